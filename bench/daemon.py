@@ -0,0 +1,77 @@
+#!/usr/bin/env python2
+"""Measure the timer daemon with many simulated timers.
+
+Runs --timers sit/stand timers on one TimerHost for --hours of simulated
+time, jumping the clock from deadline to deadline, and reports the engine
+events handled per second.  Then attaches --clients front ends over a real
+UNIX socket and reports request round trips per second.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from easytimer.daemon import Daemon, TimerHost
+from easytimer.remote import RemoteEngine
+from easytimer.scheduler import ManualClock
+
+
+def simulate(timers, hours):
+    clock = ManualClock()
+    pushed = [0]
+
+    def push(ident, msg):
+        pushed[0] += 1
+
+    host = TimerHost(clock, push=push)
+    for uid in range(timers):
+        # Stagger the starts and vary the phases so deadlines don't line up.
+        clock.set(uid * 0.01)
+        config = {"sitting_min": 20 + uid % 40, "standing_min": 5 + uid % 10}
+        host.handle((uid, "default"), {"cmd": "start", "stand": bool(uid % 2), "config": config})
+    pushed[0] = 0
+    start = time.time()
+    host.scheduler.runUntil(hours * 3600)
+    elapsed = time.time() - start
+    print("%d timers, %g simulated hours: %d events in %.2f s (%.0f events/s, %d wakeups)"
+          % (timers, hours, pushed[0], elapsed, pushed[0] / elapsed, host.scheduler.wakeups))
+
+
+def roundTrips(clients, requests):
+    path = os.path.join(tempfile.mkdtemp(), "daemon.sock")
+    daemon = Daemon(path)
+    daemon.listen()
+    thread = threading.Thread(target=daemon.serve)
+    thread.daemon = True
+    thread.start()
+    config = {"sitting_min": 50, "sitting_msg": "Sit", "standing_min": 10, "standing_msg": "Stand"}
+    engines = [RemoteEngine(path, config, name="bench%d" % num) for num in range(clients)]
+    for engine in engines:
+        engine.start(False)
+    start = time.time()
+    for _ in range(requests):
+        for engine in engines:
+            engine.request("status")
+    elapsed = time.time() - start
+    total = clients * requests
+    print("%d clients: %d round trips in %.2f s (%.0f/s)" % (clients, total, elapsed, total / elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--timers", type=int, default=10000)
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=100)
+    args = parser.parse_args()
+    simulate(args.timers, args.hours)
+    if args.clients:
+        roundTrips(args.clients, args.requests)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+#!/usr/bin/env python2
+"""Measure history queries on a large generated event log.
+
+Writes --events sit/stand events (a phase change every --every minutes,
+with the odd pause) into a throw-away log, then times opening it and
+asking for the standing minutes per day over the last year, against a
+full scan of every record.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from easytimer.history import END, PAUSE, RESUME, START, HistoryLog, HistoryReader, dayOf
+
+
+def generate(path, events, every):
+    log = HistoryLog(path)
+    stamp = time.time() - events * every * 60
+    stand = False
+    for num in range(events):
+        if num % 7 == 3:
+            log.append(PAUSE, stand, 60, stamp)
+        elif num % 7 == 4:
+            log.append(RESUME, stand, 60, stamp)
+        elif num % 2:
+            log.append(END, stand, 0, stamp)
+        else:
+            stand = not stand
+            log.append(START, stand, every * 60, stamp)
+        stamp += every * 60
+    log.close()
+
+
+def timed(label, func):
+    start = time.time()
+    result = func()
+    print("%-28s %8.1f ms" % (label, (time.time() - start) * 1000))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=2000000)
+    parser.add_argument("--every", type=float, default=10, help="minutes between events")
+    args = parser.parse_args()
+
+    temp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(temp, "easytimer.history")
+        timed("write %d events" % args.events, lambda: generate(path, args.events, args.every))
+        reader = timed("open", lambda: HistoryReader(path))
+        year = timed("standing minutes, 365 days", reader.standingMinutes)
+        timed("full scan", lambda: sum(1 for num in range(len(reader)) if reader[num]))
+        today = dayOf(time.time())
+        timed("totals, all days", lambda: reader.totals(reader.days[0], today))
+        print("%d days in the log, %.0f minutes stood in the last year"
+              % (len(reader.days), sum(year.values())))
+        reader.close()
+    finally:
+        shutil.rmtree(temp)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python2
+"""Check idle detection against a real X server, e.g. under xvfb-run.
+
+Creates the same XSync IDLETIME alarms as the timer, then --rounds times
+waits (without touching input) for the idle event, and fakes input with
+XResetScreenSaver for the "back" event.  Reports how late each event came
+after the moment it was due and how often the process woke up in between,
+and exits with status 1 if an event is missing, more than --max-late-ms
+late, or if there were wakeups other than the events themselves.
+"""
+import argparse
+import ctypes
+import os
+import select
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def wait(alarm, events, deadline):
+    """Sleep in poll() until an event arrives or `deadline`; returns the wakeups."""
+    poll = select.poll()
+    poll.register(alarm.fileno(), select.POLLIN)
+    wakeups = 0
+    count = len(events)
+    while len(events) == count and time.time() < deadline:
+        if poll.poll(max(0, int((deadline - time.time()) * 1000)) + 1):
+            wakeups += 1
+            alarm.read()
+    return wakeups
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--idle", type=float, default=1.0, help="idle seconds")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--max-late-ms", type=float, default=250.0)
+    args = parser.parse_args()
+
+    from easytimer.idle import XIdleAlarm
+    events = []
+    try:
+        alarm = XIdleAlarm(args.idle, lambda idle: events.append((idle, time.time())))
+    except OSError as exc:
+        print("Cannot watch for idleness: %s" % exc)
+        return 1
+    reset = alarm.x11.XResetScreenSaver
+    reset.argtypes = [ctypes.c_void_p]
+
+    failed = []
+    late = []
+    wakeups = 0
+    for num in range(args.rounds):
+        reset(alarm.dpy)
+        alarm.x11.XFlush(alarm.dpy)
+        due = time.time() + args.idle
+        woke = wait(alarm, events, due + 5)
+        if not events or events[-1][0] is not True:
+            failed.append("round %d: no idle event" % num)
+            break
+        late.append(events[-1][1] - due)
+        due = time.time()
+        reset(alarm.dpy)
+        alarm.x11.XFlush(alarm.dpy)
+        woke += wait(alarm, events, due + 5)
+        if events[-1][0] is not False:
+            failed.append("round %d: no event for the input" % num)
+            break
+        late.append(events[-1][1] - due)
+        wakeups += woke - 2
+    alarm.close()
+
+    print("%d rounds of %gs idle" % (args.rounds, args.idle))
+    if late:
+        print("  %-22s %10.3f" % ("max_late_ms", max(late) * 1000))
+        print("  %-22s %10.3f" % ("mean_late_ms", sum(late) * 1000 / len(late)))
+    print("  %-22s %10d" % ("extra_wakeups", wakeups))
+    if late and max(late) * 1000 > args.max_late_ms:
+        failed.append("max_late_ms %.3f > %s" % (max(late) * 1000, args.max_late_ms))
+    if wakeups > 0:
+        failed.append("extra_wakeups %d > 0" % wakeups)
+    for text in failed:
+        print("FAILED: %s" % text)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
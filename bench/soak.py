@@ -0,0 +1,207 @@
+#!/usr/bin/env python2
+"""Soak the tray: days of sit/stand cycling on a simulated clock.
+
+Drives a real SystemTrayIcon (and its SetupUI) in this process, with a
+ManualClock instead of the monotonic one and a stub "play_cmd", through
+--days of phases that each end up to --jitter seconds late, a storm of
+--storm pause/resume pairs every simulated hour and a save from the setup
+dialog every six.  Reports wakeups per simulated hour, CPU time per tick,
+how far phase ends drifted from the schedule, and the growth of RSS,
+Python objects, Qt objects and top-level widgets after the first simulated
+day.  Exits with status 1 if any of them is over its --max-* threshold.
+
+Needs a display: an Xvfb will do for Qt 4, which has no offscreen platform
+(QT_QPA_PLATFORM=offscreen is set for the Qt 5 ports regardless).
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+
+def environment():
+    """Point the timer at throw-away files; must run before it is imported."""
+    temp = tempfile.mkdtemp()
+    config = os.path.join(temp, "easytimer.conf")
+    with open(config, "w") as wr:
+        json.dump({"play_cmd": ["true"], "audio_sink": [], "notify": "popup",
+                   "sitting_sound": "sit.wav", "standing_sound": "stand.wav",
+                   "stats": True}, wr)
+    os.environ.update(EASYTIMER_CONFIG=config,
+                      EASYTIMER_HISTORY=os.path.join(temp, "easytimer.history"),
+                      EASYTIMER_SOCKET=os.path.join(temp, "easytimer.sock"))
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def rssKb():
+    try:
+        with open("/proc/self/statm") as fd:
+            return int(fd.read().split()[1]) * resource.getpagesize() // 1024
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def cpuTime():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Soak(object):
+    def __init__(self, app, args):
+        from PyQt4 import QtCore, QtGui
+        from easytimer.scheduler import ManualClock
+        from easytimer.tray import ICONS, SystemTrayIcon
+        self.QtCore = QtCore
+        self.app = app
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.clock = ManualClock(1000.0)
+        self.tray = SystemTrayIcon(QtGui.QIcon(ICONS[-1]), QtGui.QWidget(), clock=self.clock)
+        self.tray.show()
+        self.ticks = 0
+        self.paused = 0.0
+        self.drift = 0.0
+        self.saves = 0
+
+    def settle(self):
+        self.app.processEvents()
+        self.app.sendPostedEvents()
+
+    def tick(self):
+        """Jump to the next deadline, a little late, and run what is due."""
+        deadline = self.tray.scheduler.nextDeadline()
+        self.clock.set(deadline + self.random.uniform(0, self.args.jitter))
+        self.tray.runDue()
+        self.settle()
+        self.ticks += 1
+        engine = self.tray.engine
+        # Phase deadlines are anchored to the program's start, moved only by pauses.
+        self.drift = max(self.drift, abs(engine.origin - self.origin - self.paused))
+
+    def storm(self):
+        engine = self.tray.engine
+        for _ in range(self.args.storm):
+            self.tray.pauseTimer()
+            self.settle()
+            wait = self.random.uniform(0.01, 2.0)
+            self.clock.advance(wait)
+            self.paused += wait
+            self.tray.resumeTimer()
+            self.settle()
+        assert engine.running and not engine.paused
+
+    def save(self):
+        """Change a message through the setup dialog, and write it out now."""
+        self.tray.setup()
+        dialog = self.tray.setupDialog
+        self.saves += 1
+        dialog.ui.FirstText.setText("Sit Down! (%d)" % (self.saves % 2))
+        dialog.setTimerValues()
+        self.tray.store.flush()
+        self.settle()
+
+    def run(self, until):
+        nextStorm = self.clock() + HOUR
+        nextSave = self.clock() + 6 * HOUR
+        while self.clock() < until:
+            self.tick()
+            if self.clock() >= nextStorm:
+                self.storm()
+                nextStorm += HOUR
+            if self.clock() >= nextSave:
+                self.save()
+                nextSave += 6 * HOUR
+
+    def census(self):
+        gc.collect()
+        self.settle()
+        return {
+            "rss_kb": rssKb(),
+            "objects": len(gc.get_objects()),
+            "qobjects": len(self.tray.findChildren(self.QtCore.QObject)),
+            "widgets": len(self.app.topLevelWidgets()),
+        }
+
+    def main(self):
+        args = self.args
+        self.tray.startSitting()
+        self.settle()
+        self.origin = self.tray.engine.origin
+        start = self.clock()
+        self.run(start + DAY)
+        before = self.census()
+        ticks, cpu = self.ticks, cpuTime()
+        wakeups = self.tray.scheduler.wakeups
+        self.run(start + args.days * DAY)
+        cpu = cpuTime() - cpu
+        after = self.census()
+
+        late = self.tray.metrics.histograms.get("phase_late_seconds")
+        results = {
+            "wakeups_per_hour": (self.tray.scheduler.wakeups - wakeups) / ((args.days - 1) * 24.0),
+            "cpu_ms_per_tick": cpu * 1000 / max(1, self.ticks - ticks),
+            "drift_ms": self.drift * 1000,
+            "mean_late_ms": late.sum * 1000 / late.count if late and late.count else 0.0,
+        }
+        for key in after:
+            results[key + "_growth"] = after[key] - before[key]
+        print("%g simulated days, %d ticks, %d saves" % (args.days, self.ticks, self.saves))
+        for key in sorted(results):
+            print("  %-22s %10.3f" % (key, results[key]))
+
+        limits = {
+            "wakeups_per_hour": args.max_wakeups,
+            "cpu_ms_per_tick": args.max_cpu_ms,
+            "drift_ms": args.max_drift_ms,
+            "rss_kb_growth": args.max_rss_growth,
+            "objects_growth": args.max_object_growth,
+            "qobjects_growth": args.max_qobject_growth,
+            "widgets_growth": args.max_widget_growth,
+        }
+        failed = [key for key, limit in sorted(limits.items())
+                  if limit is not None and results[key] > limit]
+        for key in failed:
+            print("FAILED: %s %.3f > %s" % (key, results[key], limits[key]))
+        return 1 if failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--jitter", type=float, default=0.05,
+                        help="seconds each wakeup may come late")
+    parser.add_argument("--storm", type=int, default=20,
+                        help="pause/resume pairs every simulated hour")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--max-wakeups", type=float, default=1000)
+    parser.add_argument("--max-cpu-ms", type=float, default=5.0)
+    parser.add_argument("--max-drift-ms", type=float, default=1.0)
+    parser.add_argument("--max-rss-growth", type=int, default=4096, help="in kB")
+    parser.add_argument("--max-object-growth", type=int, default=1000)
+    parser.add_argument("--max-qobject-growth", type=int, default=0)
+    parser.add_argument("--max-widget-growth", type=int, default=0)
+    args = parser.parse_args()
+    if args.days <= 1:
+        parser.error("--days must be more than the first (warm-up) day")
+
+    environment()
+    os.chdir(ROOT)
+    from PyQt4 import QtGui
+    app = QtGui.QApplication(sys.argv)
+    app.setQuitOnLastWindowClosed(False)
+    status = Soak(app, args).main()
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python2
+"""Measure how long timer.py takes to get its tray icon up, and its memory.
+
+Launches the tray repeatedly with EASYTIMER_STARTUP set, which makes it
+report and exit as soon as its event loop first goes idle, using a
+throw-away config file and control socket.  Needs a display (an Xvfb will do),
+unless timer.py is given --headless (arguments after "--" are passed on).
+Exits with status 1 if the median exceeds --max-ms or --max-rss.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def launch(env, args):
+    start = time.time()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "timer.py")] + args,
+                            cwd=ROOT, env=env, stdout=subprocess.PIPE)
+    line = proc.stdout.readline()
+    wall = time.time() - start
+    proc.wait()
+    if not line:
+        raise SystemExit("timer.py exited with %s before reporting" % proc.returncode)
+    report = json.loads(line.decode("utf-8"))
+    report["wall"] = wall
+    return report
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, help="fail above this median wall time")
+    parser.add_argument("--max-rss", type=int, help="fail above this median RSS, in kB")
+    parser.add_argument("args", nargs="*", help="arguments for timer.py, after --")
+    args = parser.parse_args()
+
+    temp = tempfile.mkdtemp()
+    env = dict(os.environ, EASYTIMER_STARTUP="1",
+               EASYTIMER_CONFIG=os.path.join(temp, "easytimer.conf"),
+               EASYTIMER_SOCKET=os.path.join(temp, "easytimer.sock"),
+               EASYTIMER_HISTORY=os.path.join(temp, "easytimer.history"))
+    reports = [launch(env, args.args) for _ in range(args.runs)]
+
+    wall = median([report["wall"] for report in reports]) * 1000
+    visible = median([report["visible"] for report in reports]) * 1000
+    rss = median([report["rss_kb"] for report in reports])
+    print("runs: %d  to tray visible: %.1f ms (%.1f ms after imports)  RSS: %d kB"
+          % (len(reports), wall, visible, rss))
+
+    failed = ((args.max_ms and wall > args.max_ms) or
+              (args.max_rss and rss > args.max_rss))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python2
+"""Check that synced timers converge, on three instances over loopback.
+
+Runs three SyncPeers on 127.0.0.1 against one manual clock, cuts one of
+them off while both sides change the timer and the settings, heals the
+partition and checks that every instance ends up with the same entries,
+the same view of each node's writes and the same timer.  Also checks
+that phases roll over without any traffic and that forged datagrams are
+rejected.  Exits with status 1 if any check fails.
+"""
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from easytimer.config import DEFAULTS
+from easytimer.engine import TimerEngine
+from easytimer.scheduler import ManualClock, Scheduler
+from easytimer.sync import SyncPeer
+
+SECRET = "loopback"
+
+failures = []
+
+
+def check(label, ok):
+    print("%-44s %s" % (label, "ok" if ok else "FAILED"))
+    if not ok:
+        failures.append(label)
+
+
+def freePort():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def makeNodes(clock, count, cut):
+    """`count` peers listing each other; datagrams to or from an address in `cut` are lost."""
+    ports = [freePort() for _ in range(count)]
+    nodes = []
+    for port in ports:
+        scheduler = Scheduler(clock)
+        engine = TimerEngine(dict(DEFAULTS), scheduler=scheduler)
+
+        def onConfig(values, engine=engine):
+            engine.setValues(dict(engine.config, **values))
+        peers = ["127.0.0.1:%d" % other for other in ports if other != port]
+        node = SyncPeer(engine, onConfig, SECRET, "127.0.0.1", port,
+                        peers=peers, discover=False, wall=clock)
+        node.scheduler = scheduler
+        send = node.send
+
+        def lossySend(msg, addr, node=node, send=send):
+            if node.address not in cut and addr not in cut:
+                send(msg, addr)
+        node.send = lossySend
+        nodes.append(node)
+    return nodes
+
+
+def setValues(node, values):
+    """Change settings on one instance, as the tray's setup dialog does."""
+    node.engine.setValues(dict(node.engine.config, **values))
+    node.publishConfig(values)
+
+
+def pump(nodes, rounds=5):
+    """Deliver what is in flight, and whatever that sets off."""
+    for _ in range(rounds):
+        time.sleep(0.01)
+        for node in nodes:
+            node.receive()
+
+
+def timer(node):
+    engine = node.engine
+    return (engine.running, engine.number, engine.paused, round(engine.remaining(), 3))
+
+
+def converged(nodes):
+    first = nodes[0]
+    return all(node.entries == first.entries and node.known == first.known
+               and timer(node) == timer(first) for node in nodes[1:])
+
+
+def main():
+    clock = ManualClock(1000.0)
+    cut = set()
+    nodes = makeNodes(clock, 3, cut)
+    a, b, c = nodes
+    try:
+        a.engine.start(False)
+        pump(nodes)
+        check("start reaches every instance", converged(nodes) and c.engine.running)
+
+        sent = sum(node.sent for node in nodes)
+        until = clock() + a.engine.remaining() + 1
+        for node in nodes:
+            node.scheduler.runUntil(until)
+        pump(nodes)
+        check("phases roll over without traffic",
+              converged(nodes) and a.engine.number == 1
+              and sum(node.sent for node in nodes) == sent)
+
+        cut.add(c.address)
+        b.engine.pause()
+        setValues(a, {"sitting_min": 45})
+        setValues(c, {"sitting_min": 40, "standing_min": 15})
+        pump(nodes)
+        check("partition keeps the sides apart",
+              b.engine.paused and a.engine.paused and not c.engine.paused
+              and "config:standing_min" not in a.entries)
+        # The newer write wins, ties going to the higher node id.
+        winner = max(a.entries["config:sitting_min"], c.entries["config:sitting_min"],
+                     key=lambda entry: (entry[0], entry[1]))
+
+        cut.clear()
+        clock.advance(a.interval)
+        for node in nodes:
+            node.tick()
+        pump(nodes)
+        check("healed partition converges", converged(nodes))
+        check("concurrent writes settle on one value",
+              all(node.entries["config:sitting_min"] == winner for node in nodes)
+              and all(node.engine.config["sitting_min"] == winner[3] for node in nodes)
+              and all(node.engine.config["standing_min"] == 15 for node in nodes))
+
+        a.engine.resume()
+        b.engine.stop()
+        pump(nodes)
+        check("racing timer changes converge", converged(nodes))
+
+        received = a.received
+        forged = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        forged.sendto(b"0" * 64 + b'{"t":"delta","entries":{}}', a.address)
+        forged.close()
+        pump(nodes)
+        check("forged datagram is rejected", a.rejected == 1 and a.received == received)
+    finally:
+        for node in nodes:
+            node.close()
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
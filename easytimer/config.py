@@ -0,0 +1,264 @@
+import ctypes
+import ctypes.util
+import errno
+import json
+import logging
+import os
+import struct
+import tempfile
+from threading import Lock, Timer
+
+logger = logging.getLogger(__name__)
+
+CONFIG_FILE = os.environ.get("EASYTIMER_CONFIG") or os.path.expanduser(
+    os.path.join("~", ".config", "easytimer.conf"))
+
+DEFAULTS = {
+    "sitting_min": 50,
+    "sitting_msg": "Sit Down!",
+    "sitting_sound": '',
+    "standing_min": 10,
+    "standing_msg": "Stand Up!",
+    "standing_sound": '',
+    "program": '',
+    "programs": {},
+    "timers": {},
+
+    "text_minimum": "Timeouts must be at least 1 minute.",
+    "text_should": "You should {act}\nFor: {mins} minutes",
+    "tip_inactive": "Not running",
+    "tip_active": "You should {act}\n({mins:g} minutes remaining)",
+    "tip_timer": "{name}: {act} ({mins:g} min)",
+    "title_error": "Error",
+    "title_normal": "Sit/Stand Timer",
+    "files_audio": "Audio Files (*.mp3 *.ogg *.flc *.flac *.wav)",
+    "files_all": "All Files (*)",
+    "sound_standing": "Standing Sound",
+    "sound_sitting": "Sitting Sound",
+    "text_sit": "Start Sitting",
+    "text_stand": "Start Standing",
+    "text_start": "Start",
+    "text_cancel": "Cancel Timer",
+    "text_pause": "Pause Timer",
+    "text_paused": "(PAUSE)",
+    "error_resume": "Not paused.",
+    "error_pause": "Already paused.",
+    "text_resume": "Resume Timer",
+    "text_setup": "Configure...",
+    "text_exit": "Exit",
+
+    "play_cmd": ["xdg-open"],
+    "audio_sink": ["aplay", "-q", "-t", "raw", "-f", "{format}",
+                   "-c", "{channels}", "-r", "{rate}"],
+    "audio_file": "",
+    "audio_decoder": ["ffmpeg", "-v", "quiet", "-i", "{file}", "-f", "wav", "-"],
+    "sound_queue": 4,
+    "sound_policy": "coalesce",
+    "sound_timeout": 30,
+    "sound_stale": 10,
+    "icon_ring": True,
+    "icon_steps": 60,
+    "tip_quantum": 1,
+    "daemon_socket": "",
+    "history": True,
+    "stats": False,
+    "stats_file": "",
+    "stats_interval": 60,
+    "notify": "auto",
+    "notify_cmd": ["notify-send", "--app-name=EasyTimer", "--expire-time={ms}",
+                   "{title}", "{text}"],
+    "notify_timeout": 0,
+    "popup_pool": 3,
+    "tty_bell": False,
+    "status_file": "",
+    "sync": False,
+    "sync_secret": "",
+    "sync_bind": ":47123",
+    "sync_peers": [],
+    "sync_discover": True,
+    "sync_interval": 30,
+    "hooks": {},
+    "hook_workers": 4,
+    "idle_pause": 0,
+    "lock_pause": False
+}
+
+SAVE_DELAY = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """Watches one directory for files written or renamed into it (Linux only)."""
+    def __init__(self, path, mask=IN_CLOSE_WRITE | IN_MOVED_TO):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        path = path.encode() if not isinstance(path, bytes) else path
+        if libc.inotify_add_watch(self.fd, path, mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch")
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """The names of the files changed since the last call; never blocks."""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError as exc:
+                if exc.errno == errno.EAGAIN:
+                    return names
+                raise
+            pos = 0
+            while pos < len(data):
+                _, _, _, size = EVENT.unpack_from(data, pos)
+                pos += EVENT.size
+                names.add(data[pos:pos + size].rstrip(b'\0').decode('utf-8', 'replace'))
+                pos += size
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class ConfigStore(object):
+    """The user's configuration, backed by a JSON file.
+
+    Only values that differ from `defaults` are written.  Writes are
+    debounced by `delay` seconds, coalesced and done atomically (a temporary
+    file renamed over the original) on a background thread.  With `watch`,
+    edits made to the file by anyone else are picked up by `readChanges`.
+    """
+    def __init__(self, path=CONFIG_FILE, defaults=DEFAULTS, delay=SAVE_DELAY):
+        self.path = path
+        self.defaults = defaults
+        self.delay = delay
+        self.config = dict(defaults)
+        self.writable = True
+        self.pending = {}
+        self.written = None
+        self.timer = None
+        self.lock = Lock()
+        # Held through the file I/O, which `lock` must never be.
+        self.saving = Lock()
+        self.inotify = None
+
+    def get(self, key, default=None):
+        return self.config.get(key, self.defaults.get(key, default))
+
+    def read(self):
+        """The file's contents merged over the defaults; None if it is unreadable."""
+        config = dict(self.defaults)
+        try:
+            with open(self.path) as fd:
+                data = fd.read()
+            loaded = json.loads(data)
+            if not isinstance(loaded, dict):
+                raise ValueError("not a JSON object")
+            config.update(loaded)
+        except (IOError, OSError, ValueError) as exc:
+            if getattr(exc, 'errno', None) == errno.ENOENT:
+                return config
+            logger.warning("Cannot read %s: %s", self.path, exc)
+            return None
+        self.written = data
+        return config
+
+    def load(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                self.writable = False
+        self.config.clear()
+        self.config.update(self.read() or self.defaults)
+        return self.config
+
+    def watch(self):
+        """Start watching the file; returns a descriptor to wait on, or None."""
+        if self.inotify is None:
+            try:
+                self.inotify = Inotify(os.path.dirname(self.path))
+            except (OSError, AttributeError, TypeError) as exc:
+                logger.info("Not watching %s: %s", self.path, exc)
+                return None
+        return self.inotify.fileno()
+
+    def readChanges(self):
+        """Apply edits made to the file by others; returns True if anything changed."""
+        if self.inotify is None or os.path.basename(self.path) not in self.inotify.read():
+            return False
+        with self.lock:
+            previous = self.written
+            config = self.read()
+            if config is None or self.written == previous:
+                return False
+            # Values changed here but not yet saved win over the file.
+            config.update(self.pending)
+            if config == self.config:
+                return False
+            self.config.clear()
+            self.config.update(config)
+        return True
+
+    def update(self, **values):
+        with self.lock:
+            self.config.update(values)
+            if not self.writable:
+                return
+            self.pending.update(values)
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = Timer(self.delay, self.save)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def save(self):
+        """Write the settings out; `update` (on the GUI thread) never waits for the disk."""
+        with self.saving:
+            with self.lock:
+                self.timer = None
+                self.pending.clear()
+                saved = dict((key, value) for key, value in self.config.items()
+                             if self.defaults.get(key) != value)
+                data = json.dumps(saved, indent=4, sort_keys=True)
+                if data == self.written:
+                    return
+            temp = None
+            try:
+                fd, temp = tempfile.mkstemp(prefix=".easytimer.", dir=os.path.dirname(self.path))
+                with os.fdopen(fd, 'w') as wr:
+                    wr.write(data)
+                    wr.flush()
+                    os.fsync(wr.fileno())
+                os.rename(temp, self.path)
+            except (IOError, OSError):
+                logger.exception("Cannot save %s", self.path)
+                if temp is not None and os.path.exists(temp):
+                    os.remove(temp)
+                return
+            with self.lock:
+                self.written = data
+
+    def flush(self):
+        """Write any pending changes now, e.g. before exiting."""
+        timer = self.timer
+        if timer is not None:
+            timer.cancel()
+            self.save()
+
+    def close(self):
+        self.flush()
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
@@ -0,0 +1,230 @@
+import collections
+import errno
+import fcntl
+import json
+import logging
+import os
+import socket
+import sys
+import tempfile
+
+from easytimer.metrics import prometheus
+from easytimer.protocol import STRINGS, LineBuffer, encode
+
+logger = logging.getLogger(__name__)
+
+CONTROL_SOCKET = os.environ.get("EASYTIMER_SOCKET") or os.path.join(
+    os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir(),
+    "easytimer-%d.sock" % os.getuid())
+
+TIMEOUT = 2.0
+
+# Connections that have not sent their request yet; the oldest is dropped
+# to make room beyond this.
+MAX_PENDING = 8
+
+COMMANDS = ("sit", "stand", "pause", "resume", "stop", "status", "stats", "setup", "quit")
+
+# The "cmd" of the requests those turn into.
+REQUESTS = ("start", "pause", "resume", "stop", "status", "stats", "setup", "quit")
+
+
+def alive(path=CONTROL_SOCKET):
+    """Whether an instance is listening on `path`."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+
+def request(cmd, path=CONTROL_SOCKET, timeout=TIMEOUT, **args):
+    """Send one command to the running instance; returns its reply, or None if none runs."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+    try:
+        args.update(cmd=cmd, id=1)
+        sock.sendall(encode(args))
+        buffer = LineBuffer()
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                return None
+            for msg in buffer.feed(data):
+                return msg
+    except socket.error:
+        logger.warning("No answer from %s", path)
+        return None
+    finally:
+        sock.close()
+
+
+def checkRequest(msg):
+    """Why `msg` is not a request the control server can handle, or None if it is."""
+    if not isinstance(msg, dict):
+        return "not a JSON object"
+    if not isinstance(msg.get("cmd"), STRINGS) or msg["cmd"] not in REQUESTS:
+        return "unknown command: %r" % (msg.get("cmd"),)
+    if msg.get("timer") is not None and not isinstance(msg["timer"], STRINGS):
+        return "\"timer\" is not a string"
+    return None
+
+
+class ControlServer(object):
+    """The listening end of `request`, which also keeps a single instance running.
+
+    `handler(msg)` returns the reply to each request.  The owner calls
+    `accept` whenever `fileno()` becomes readable; each connection is then
+    handed to `watch(fd, callback)`, for the owner to call `callback()`
+    whenever `fd` is readable, until `unwatch(fd)`.  Nothing here waits
+    for a client.
+    """
+    def __init__(self, handler, path=CONTROL_SOCKET):
+        self.handler = handler
+        self.watch = None
+        self.unwatch = None
+        self.path = path
+        self.sock = None
+        self.conns = collections.OrderedDict()
+
+    def listen(self):
+        """Start listening; returns False if another instance already is."""
+        # Two instances starting at once must not both take a stale socket over.
+        with open(self.path + ".lock", 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.bind(self.path)
+            except socket.error as exc:
+                if exc.args[0] != errno.EADDRINUSE or alive(self.path):
+                    sock.close()
+                    return False
+                # Left behind by an instance that died.
+                os.unlink(self.path)
+                sock.bind(self.path)
+            os.chmod(self.path, 0o600)
+            sock.listen(8)
+        sock.setblocking(False)
+        self.sock = sock
+        return True
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.error as exc:
+                if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            conn.setblocking(False)
+            fd = conn.fileno()
+            if len(self.conns) >= MAX_PENDING:
+                self.drop(next(iter(self.conns)))
+            self.conns[fd] = (conn, LineBuffer())
+            self.watch(fd, lambda fd=fd: self.read(fd))
+
+    def read(self, fd):
+        conn, buffer = self.conns[fd]
+        try:
+            data = conn.recv(65536)
+            if not data:
+                self.drop(fd)
+                return
+            messages = buffer.feed(data)
+        except socket.error as exc:
+            if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            logger.warning("Control request failed: %s", exc)
+            self.drop(fd)
+            return
+        except ValueError as exc:
+            logger.warning("Bad control request: %s", exc)
+            self.drop(fd)
+            return
+        if not messages:
+            return
+        # Clients send a single request and wait for the answer, which is
+        # small enough for the socket buffer.
+        conn.settimeout(TIMEOUT)
+        try:
+            for msg in messages:
+                conn.sendall(encode(self.reply(msg)))
+        except socket.error:
+            logger.exception("Control request failed")
+        finally:
+            self.drop(fd)
+
+    def reply(self, msg):
+        """The handler's reply to `msg`, or an error reply; never raises."""
+        error = checkRequest(msg)
+        if error is not None:
+            return {"id": msg.get("id") if isinstance(msg, dict) else None, "ok": False,
+                    "error": "bad request: " + error}
+        try:
+            reply = self.handler(msg)
+        except Exception as exc:
+            logger.exception("Control request %r failed", msg)
+            reply = {"ok": False, "error": str(exc)}
+        reply["id"] = msg.get("id")
+        return reply
+
+    def drop(self, fd):
+        entry = self.conns.pop(fd, None)
+        if entry is not None:
+            self.unwatch(fd)
+            entry[0].close()
+
+    def close(self):
+        for fd in list(self.conns):
+            self.drop(fd)
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+def describe(state):
+    if not state["running"]:
+        return "Not running"
+    text = "%s (%.1f minutes remaining)" % (state["msg"], state["remaining"] / 60.0)
+    if state["paused"]:
+        text += " (PAUSE)"
+    return text
+
+
+def run(cmd, asJson=False, path=CONTROL_SOCKET, timer=None):
+    """Carry out a command-line command on one timer; returns the exit status."""
+    args = {"timer": timer} if timer else {}
+    if cmd in ("sit", "stand"):
+        args["stand"] = cmd == "stand"
+        cmd = "start"
+    reply = request(cmd, path, **args)
+    if reply is None:
+        print("EasyTimer is not running.")
+        return 2
+    if asJson:
+        print(json.dumps(reply, sort_keys=True))
+    elif reply.get("error"):
+        print(reply["error"])
+    elif "stats" in reply:
+        sys.stdout.write(prometheus(reply["stats"]))
+    elif "timers" in reply and not timer:
+        for name, state in sorted(reply["timers"].items()):
+            print("%s: %s" % (name, describe(state)))
+    elif "state" in reply:
+        print(describe(reply["state"]))
+    return 0 if reply.get("ok") else 1
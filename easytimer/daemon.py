@@ -0,0 +1,259 @@
+import argparse
+import errno
+import logging
+import os
+import select
+import socket
+import struct
+
+from easytimer.config import DEFAULTS
+from easytimer.engine import CONFIG_KEYS, TIME_KEYS, TimerEngine
+from easytimer.protocol import DAEMON_SOCKET, STRINGS, LineBuffer, encode
+from easytimer.scheduler import Scheduler, monotonic
+
+logger = logging.getLogger(__name__)
+
+READ = select.POLLIN | select.POLLPRI | select.POLLHUP | select.POLLERR
+WRITE = select.POLLOUT
+MAX_BUFFER = 1024 * 1024
+
+
+def checkRequest(msg):
+    """Why `msg` is not a request the daemon can handle, or None if it is."""
+    if not isinstance(msg, dict):
+        return "not a JSON object"
+    if not isinstance(msg.get("name", "default"), STRINGS):
+        return "\"name\" is not a string"
+    if not isinstance(msg.get("cmd"), STRINGS):
+        return "\"cmd\" is not a string"
+    if not isinstance(msg.get("config", {}), dict):
+        return "\"config\" is not an object"
+    try:
+        hash(msg.get("id"))
+    except TypeError:
+        return "\"id\" is not a number or a string"
+    return None
+
+
+def peerUid(sock):
+    """The uid of the process at the other end of a UNIX socket, if known."""
+    try:
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return struct.unpack("3i", creds)[1]
+    except (AttributeError, socket.error):
+        return None
+
+
+class Client(object):
+    def __init__(self, sock):
+        self.sock = sock
+        self.uid = peerUid(sock)
+        self.buffer = LineBuffer()
+        self.output = b''
+        self.ident = None
+
+
+class TimerHost(object):
+    """Sit/stand timers for any number of users, all on one scheduler.
+
+    Timers are identified by (uid, name) and keep running while nobody is
+    attached to them.  `push(ident, msg)` is called for every engine event.
+    """
+    def __init__(self, clock=monotonic, push=None):
+        self.scheduler = Scheduler(clock)
+        self.timers = {}
+        self.push = push
+
+    def timer(self, ident, config=None):
+        engine = self.timers.get(ident)
+        if engine is None:
+            values = dict((key, DEFAULTS[key]) for key in TIME_KEYS)
+            values.update(config or {})
+            engine = TimerEngine(values, scheduler=self.scheduler, key=ident)
+            engine.listen(lambda event, engine: self.notify(ident, event, engine))
+            self.timers[ident] = engine
+        elif config:
+            engine.setValues(dict(engine.config, **config))
+        return engine
+
+    def notify(self, ident, event, engine):
+        if self.push is not None:
+            self.push(ident, {"event": event, "state": engine.state()})
+
+    def handle(self, ident, msg):
+        """Run one request against the timer `ident`; returns the reply."""
+        cmd = msg.get("cmd")
+        config = dict((key, msg["config"][key]) for key in CONFIG_KEYS
+                      if key in msg.get("config", {}))
+        try:
+            engine = self.timer(ident, config)
+        except (TypeError, ValueError) as exc:
+            return {"id": msg.get("id"), "ok": False, "error": str(exc)}
+        reply = {"id": msg.get("id"), "ok": True}
+        if cmd == "start":
+            engine.start(bool(msg.get("stand")))
+        elif cmd == "stop":
+            engine.stop()
+        elif cmd == "pause":
+            reply["ok"] = engine.pause()
+        elif cmd == "resume":
+            reply["ok"] = engine.resume()
+        elif cmd not in ("attach", "status", "config"):
+            reply.update(ok=False, error="unknown command: %s" % cmd)
+        reply["state"] = engine.state()
+        return reply
+
+
+class Daemon(object):
+    """Serves a TimerHost over a UNIX socket.
+
+    The loop sleeps in poll() until a client talks or the soonest deadline
+    of any timer comes up; attached clients get every event pushed to them.
+    """
+    def __init__(self, path=DAEMON_SOCKET, clock=monotonic):
+        self.path = path
+        self.host = TimerHost(clock, push=self.push)
+        self.clients = {}
+        self.attached = {}
+        self.poll = select.poll()
+        self.server = None
+
+    def listen(self):
+        try:
+            os.unlink(self.path)
+        except OSError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        # Users are told apart by their uid, so everyone may connect.
+        os.chmod(self.path, 0o666)
+        self.server.listen(128)
+        self.server.setblocking(False)
+        self.poll.register(self.server.fileno(), READ)
+
+    def serve(self):
+        if self.server is None:
+            self.listen()
+        scheduler = self.host.scheduler
+        while True:
+            deadline = scheduler.nextDeadline()
+            timeout = None
+            if deadline is not None:
+                timeout = max(0, int((deadline - scheduler.clock()) * 1000) + 1)
+            try:
+                ready = self.poll.poll(timeout)
+            except (select.error, IOError) as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, flags in ready:
+                if fd == self.server.fileno():
+                    self.accept()
+                elif fd in self.clients:
+                    self.service(self.clients[fd], flags)
+            scheduler.runDue()
+
+    def accept(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except socket.error as exc:
+                if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+            sock.setblocking(False)
+            client = Client(sock)
+            self.clients[sock.fileno()] = client
+            self.poll.register(sock.fileno(), READ)
+
+    def service(self, client, flags):
+        if flags & WRITE:
+            self.flush(client)
+        if not flags & READ or client.sock.fileno() not in self.clients:
+            return
+        try:
+            data = client.sock.recv(65536)
+        except socket.error as exc:
+            if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = b''
+        if not data:
+            self.drop(client)
+            return
+        try:
+            messages = client.buffer.feed(data)
+        except ValueError as exc:
+            logger.warning("Dropping client uid %s: %s", client.uid, exc)
+            self.drop(client)
+            return
+        for msg in messages:
+            # One user's bad request must not take the daemon down for everyone.
+            error = checkRequest(msg)
+            if error is not None:
+                self.send(client, {"id": None, "ok": False, "error": "bad request: " + error})
+                continue
+            try:
+                self.request(client, msg)
+            except Exception as exc:
+                logger.exception("Request from uid %s failed: %r", client.uid, msg)
+                self.send(client, {"id": msg.get("id"), "ok": False, "error": str(exc)})
+            if client.sock.fileno() not in self.clients:
+                return
+
+    def request(self, client, msg):
+        ident = (client.uid, msg.get("name", "default"))
+        if msg.get("cmd") == "attach":
+            self.detach(client)
+            client.ident = ident
+            self.attached.setdefault(ident, set()).add(client)
+        self.send(client, self.host.handle(ident, msg))
+
+    def push(self, ident, msg):
+        for client in list(self.attached.get(ident, ())):
+            self.send(client, msg)
+
+    def send(self, client, msg):
+        client.output += encode(msg)
+        if len(client.output) > MAX_BUFFER:
+            logger.warning("Dropping client that stopped reading: uid %s", client.uid)
+            self.drop(client)
+            return
+        self.flush(client)
+
+    def flush(self, client):
+        try:
+            sent = client.sock.send(client.output)
+            client.output = client.output[sent:]
+        except socket.error as exc:
+            if exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.drop(client)
+                return
+        if client.sock.fileno() in self.clients:
+            self.poll.modify(client.sock.fileno(), READ | WRITE if client.output else READ)
+
+    def detach(self, client):
+        watchers = self.attached.get(client.ident)
+        if watchers:
+            watchers.discard(client)
+            if not watchers:
+                del self.attached[client.ident]
+
+    def drop(self, client):
+        fd = client.sock.fileno()
+        if self.clients.pop(fd, None) is not None:
+            self.poll.unregister(fd)
+        self.detach(client)
+        client.sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Host sit/stand timers for many users.")
+    parser.add_argument("--socket", default=DAEMON_SOCKET, help="path of the UNIX socket")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("EASYTIMER_LOG", "WARNING").upper())
+    Daemon(args.socket).serve()
+
+
+if __name__ == "__main__":
+    main()
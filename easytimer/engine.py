@@ -0,0 +1,175 @@
+from easytimer.program import compileProgram
+from easytimer.scheduler import Scheduler, monotonic
+
+TIME_KEYS = ("sitting_min", "sitting_msg", "standing_min", "standing_msg")
+
+# Everything the engine reads from the configuration.
+CONFIG_KEYS = TIME_KEYS + ("sitting_sound", "standing_sound", "program", "programs")
+
+EVENTS = ("start", "end", "pause", "resume", "stop")
+
+# Differences in the time left smaller than this (in seconds) are not worth a jump.
+JUMP_TOLERANCE = 1.0
+
+
+class TimerEngine(object):
+    """The sit/stand cycle (or any other program), with no user interface attached.
+
+    Listeners are called as `listener(event, engine)` for each of EVENTS; the
+    countdown itself is a single deadline on the (possibly shared) scheduler.
+    Phase ends are computed from the program's compiled timeline and the
+    time the program (notionally) started, so they never accumulate drift.
+    """
+    def __init__(self, config, clock=monotonic, scheduler=None, key='phase'):
+        self.scheduler = scheduler if scheduler is not None else Scheduler(clock)
+        self.key = key
+        self.listeners = []
+        self.number = 0
+        self.phase = None
+        self.origin = None
+        self.deadline = None
+        self.left = 0
+        self.paused = False
+        self.setValues(config)
+
+    def setValues(self, config):
+        values = dict((key, config[key]) for key in CONFIG_KEYS if key in config)
+        # Compiled first, so a bad config leaves the engine as it was.
+        self.timeline = compileProgram(values)
+        self.config = values
+        if self.deadline is not None:
+            # The current phase runs its course, then the new program takes over.
+            self.number %= len(self.timeline.phases)
+            self.origin = self.deadline - self.timeline.offset(self.number + 1)
+
+    def listen(self, listener):
+        self.listeners.append(listener)
+
+    def emit(self, event):
+        for listener in list(self.listeners):
+            listener(event, self)
+
+    @property
+    def clock(self):
+        return self.scheduler.clock
+
+    @property
+    def running(self):
+        return self.deadline is not None
+
+    @property
+    def stand(self):
+        return self.phase.stand if self.phase else False
+
+    @property
+    def msg(self):
+        return self.phase.msg if self.phase else None
+
+    def minutes(self):
+        phase = self.phase or self.timeline.phases[0]
+        return phase.seconds / 60.0
+
+    def remaining(self):
+        if self.paused or self.deadline is None:
+            return self.left
+        return max(0.0, self.deadline - self.clock())
+
+    def elapsed(self):
+        """Seconds into the program, pauses excluded."""
+        if self.deadline is None:
+            return 0.0
+        return self.timeline.offset(self.number + 1) - self.remaining()
+
+    def state(self):
+        return {
+            "stand": self.stand,
+            "paused": self.paused,
+            "running": self.running,
+            "remaining": self.remaining(),
+            "minutes": self.minutes(),
+            "msg": self.msg,
+            "phase": self.phase.name if self.phase else None,
+            "icon": self.phase.icon if self.phase else None,
+            "sound": self.phase.sound if self.phase else None,
+            "number": self.number,
+        }
+
+    def start(self, stand):
+        self.startPhase(self.timeline.first(stand))
+
+    def startPhase(self, number):
+        self.paused = False
+        self.origin = self.clock() - self.timeline.offset(number)
+        self.enter(number)
+
+    def seek(self, elapsed):
+        """Jump to `elapsed` seconds into the program; stops if that is past its end."""
+        number, left = self.timeline.locate(elapsed)
+        if number is None:
+            self.stop()
+            return
+        self.paused = False
+        self.origin = self.clock() + left - self.timeline.offset(number + 1)
+        self.enter(number)
+
+    def jump(self, number, left, paused=False):
+        """Take over the `number`th phase with `left` seconds to go, e.g. from another instance.
+
+        Staying in the same phase only moves (or pauses) its deadline, so
+        the phase is not announced again.
+        """
+        if not (self.running and self.number == number):
+            self.seek(self.timeline.offset(number + 1) - left)
+            if not (paused and self.running):
+                return
+        if paused:
+            self.pause()
+            self.left = max(0.0, left)
+        elif self.paused or abs(self.remaining() - left) >= JUMP_TOLERANCE:
+            self.paused = True
+            self.left = left
+            self.resume()
+
+    def enter(self, number):
+        self.number = number
+        self.phase = self.timeline.phase(number)
+        self.deadline = self.origin + self.timeline.offset(number + 1)
+        self.scheduler.schedule(self.key, self.deadline, self.end)
+        self.emit("start")
+
+    def end(self):
+        self.emit("end")
+        if self.timeline.finished(self.number + 1):
+            self.stop()
+        else:
+            self.enter(self.number + 1)
+
+    def stop(self):
+        self.scheduler.cancel(self.key)
+        self.deadline = None
+        self.left = 0
+        self.paused = False
+        self.emit("stop")
+
+    def pause(self):
+        """Freeze the countdown; returns False if it was already paused."""
+        if self.paused:
+            return False
+        self.left = self.remaining()
+        self.paused = True
+        self.scheduler.cancel(self.key)
+        self.emit("pause")
+        return True
+
+    def resume(self):
+        """Continue a paused countdown; returns False if it was not paused."""
+        if not self.paused:
+            return False
+        self.paused = False
+        if self.deadline is not None:
+            deadline = self.clock() + self.left
+            self.origin += deadline - self.deadline
+            self.deadline = deadline
+            self.scheduler.schedule(self.key, self.deadline, self.end)
+        self.emit("resume")
+        return True
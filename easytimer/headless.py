@@ -0,0 +1,190 @@
+import errno
+import logging
+import math
+import os
+import select
+import signal
+import sys
+import time
+
+from easytimer.scheduler import Scheduler, monotonic
+from easytimer.session import MAIN_TIMER, Session
+
+logger = logging.getLogger(__name__)
+
+READ = select.POLLIN | select.POLLPRI
+
+
+class HeadlessTimer(Session):
+    """The sit/stand cycle without Qt, for SSH sessions and trayless desktops.
+
+    Announces phases on `out`, with the terminal bell if `bell`, and keeps
+    "status_file" holding a one-line status for a status bar.  With `tty`
+    a live status line is also redrawn in place.  Between events the
+    process sleeps in poll() until the next deadline, a control request
+    or a change to the config file.
+    """
+    def __init__(self, control=None, out=sys.stdout, tty=False, bell=None,
+                 statusFile=None, clock=monotonic):
+        self.out = out
+        self.tty = tty
+        self.shown = None
+        self.running = False
+        self.poll = select.poll()
+        self.handlers = {}
+        self.loadConfig()
+        self.bell = self.config.get('tty_bell') if bell is None else bell
+        self.statusFile = os.path.expanduser(statusFile or self.config.get('status_file') or "")
+        self.scheduler = Scheduler(clock)
+        self.engine = self.makeEngine(self.config, scheduler=self.scheduler)
+        self.engine.name = MAIN_TIMER
+        self.engine.listen(self.onEvent)
+        self.timers = {MAIN_TIMER: self.engine}
+        self.openSession(control)
+        self.loadSounds()
+        self.watchAway()
+
+    def watch(self, fd, handler):
+        self.handlers[fd] = handler
+        self.poll.register(fd, READ)
+
+    def unwatch(self, fd):
+        if self.handlers.pop(fd, None) is not None:
+            self.poll.unregister(fd)
+
+    def error(self, text):
+        self.say(text)
+
+    def requestSetup(self):
+        return "There is no setup dialog without a tray; edit %s instead." % self.store.path
+
+    def requestQuit(self):
+        self.running = False
+
+    def updateTimers(self):
+        self.engine.setValues(self.config)
+
+    def applyConfig(self):
+        if Session.applyConfig(self):
+            self.refresh()
+
+    def onStart(self, engine):
+        if engine.phase.sound:
+            self.sounds.playSound(engine.phase.sound)
+        msg = self.getText("text_should").format(act=engine.msg, mins=float(engine.minutes()))
+        self.say(msg.replace("\n", " "), bell=self.bell)
+        self.refresh()
+
+    def onPause(self, engine):
+        self.say(self.getText("text_pause"))
+        self.refresh()
+
+    def onStop(self, engine):
+        self.say(self.getText("tip_inactive"))
+        self.refresh()
+
+    def onResume(self, engine):
+        self.refresh()
+
+    def onEnd(self, engine):
+        pass
+
+    def say(self, text, bell=False):
+        if self.tty:
+            # Clear the live status line first.
+            self.out.write("\r\033[K")
+        self.out.write("%s%s %s\n" % ("\a" if bell else "", time.strftime("%H:%M"), text))
+        self.shown = None
+        self.out.flush()
+
+    def status(self):
+        engine = self.engine
+        if not engine.running:
+            return self.getText("tip_inactive")
+        text = "%s %dm" % (engine.msg, int(math.ceil(engine.remaining() / 60.0 - 1e-9)))
+        if engine.paused:
+            text += " " + self.getText("text_paused")
+        return text
+
+    def refresh(self):
+        """Show the status, and wake up again only when its minutes would change."""
+        text = self.status()
+        if text != self.shown:
+            self.shown = text
+            if self.tty:
+                self.out.write("\r\033[K" + text)
+                self.out.flush()
+            if self.statusFile:
+                self.writeStatus(text)
+        engine = self.engine
+        left = engine.remaining()
+        if engine.paused or not engine.running or left <= 60:
+            self.scheduler.cancel('status')
+            return
+        steps = math.ceil(left / 60.0 - 1e-9) - 1
+        self.scheduler.schedule('status', engine.deadline - steps * 60.0, self.refresh)
+
+    def writeStatus(self, text):
+        temp = self.statusFile + ".tmp"
+        try:
+            with open(temp, 'w') as wr:
+                wr.write(text + "\n")
+            os.rename(temp, self.statusFile)
+        except (IOError, OSError):
+            logger.exception("Cannot write %s", self.statusFile)
+
+    def serve(self, stand=False, started=None):
+        """Run the cycle until told to quit; reports and returns at once if `started`."""
+        self.running = True
+        self.engine.start(stand)
+        if started is not None:
+            reportStartup(started)
+            return
+        scheduler = self.scheduler
+        try:
+            while self.running:
+                deadline = scheduler.nextDeadline()
+                timeout = None
+                if deadline is not None:
+                    timeout = max(0, int((deadline - scheduler.clock()) * 1000) + 1)
+                try:
+                    ready = self.poll.poll(timeout)
+                except (select.error, IOError) as exc:
+                    if exc.args[0] == errno.EINTR:
+                        continue
+                    raise
+                for fd, _ in ready:
+                    self.handlers[fd]()
+                scheduler.runDue()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.tty:
+                self.out.write("\n")
+            self.shutdown()
+
+
+def reportStartup(started):
+    """Print the time until the first phase started and the RSS, like the tray does."""
+    import json
+    import resource
+    print(json.dumps({
+        "visible": time.time() - started,
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+    sys.stdout.flush()
+
+
+def main(control, stand=False, tty=False, statusFile=None, start=None):
+    logging.basicConfig(level=os.environ.get("EASYTIMER_LOG", "WARNING").upper())
+    startup = os.environ.get("EASYTIMER_STARTUP")
+    # When measuring startup, the report must be the first line out.
+    out = open(os.devnull, 'w') if startup else sys.stdout
+    timer = HeadlessTimer(control, out=out, tty=tty, bell=True if tty else None,
+                          statusFile=statusFile)
+    # Ends the loop the same way as Ctrl-C.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        timer.serve(stand, start if startup else None)
+    finally:
+        control.close()
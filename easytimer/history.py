@@ -0,0 +1,173 @@
+import bisect
+import collections
+import datetime
+import mmap
+import os
+import struct
+import time
+
+HISTORY_FILE = os.environ.get("EASYTIMER_HISTORY") or os.path.expanduser(
+    os.path.join("~", ".config", "easytimer.history"))
+
+# Each event is one fixed-width record: wall-clock time, event code, whether
+# the phase is a standing one, and the phase length (or time left) in seconds.
+RECORD = struct.Struct("<dBBxxf")
+# The index holds one entry per local day: its ordinal and first record.
+INDEX = struct.Struct("<II")
+
+START, END, PAUSE, RESUME, STOP = range(1, 6)
+CODES = {"start": START, "end": END, "pause": PAUSE, "resume": RESUME, "stop": STOP}
+
+
+def dayOf(stamp):
+    return datetime.date.fromtimestamp(stamp).toordinal()
+
+
+def midnight(day):
+    """The timestamp at which a local day (an ordinal) starts."""
+    return time.mktime(datetime.date.fromordinal(day).timetuple())
+
+
+class HistoryLog(object):
+    """Appends timer events to the history file and keeps its day index current."""
+    def __init__(self, path=HISTORY_FILE, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self.log = open(path, 'ab')
+        self.index = open(path + '.idx', 'ab')
+        self.count = self.truncate(self.log, RECORD.size)
+        self.day = None
+        if self.truncate(self.index, INDEX.size):
+            with open(path + '.idx', 'rb') as fd:
+                fd.seek(-INDEX.size, os.SEEK_END)
+                self.day = INDEX.unpack(fd.read(INDEX.size))[0]
+
+    @staticmethod
+    def truncate(fd, size):
+        """Drop a partial record left by a torn write; returns the number of whole ones."""
+        length = os.fstat(fd.fileno()).st_size
+        if length % size:
+            os.ftruncate(fd.fileno(), length - length % size)
+        return length // size
+
+    def append(self, code, stand, seconds, stamp=None):
+        stamp = self.clock() if stamp is None else stamp
+        day = dayOf(stamp)
+        if day != self.day:
+            self.index.write(INDEX.pack(day, self.count))
+            self.index.flush()
+            self.day = day
+        self.log.write(RECORD.pack(stamp, code, bool(stand), seconds))
+        self.log.flush()
+        self.count += 1
+
+    def record(self, event, engine):
+        """An engine listener."""
+        seconds = engine.minutes() * 60 if event == "start" else engine.remaining()
+        self.append(CODES[event], engine.stand, seconds)
+
+    def finish(self, engine):
+        """Record a stop for a timer still running as the program exits."""
+        if engine.running:
+            self.record("stop", engine)
+
+    def close(self):
+        self.log.close()
+        self.index.close()
+
+
+class HistoryReader(object):
+    """Queries the history file through memory maps, reading only the days asked for."""
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.log = self.mapFile(path)
+        self.count = len(self.log) // RECORD.size if self.log is not None else 0
+        self.days = []
+        self.firsts = []
+        index = self.mapFile(path + '.idx')
+        if index is not None:
+            for pos in range(0, len(index) - len(index) % INDEX.size, INDEX.size):
+                day, first = INDEX.unpack_from(index, pos)
+                self.days.append(day)
+                self.firsts.append(first)
+            index.close()
+
+    @staticmethod
+    def mapFile(path):
+        try:
+            with open(path, 'rb') as fd:
+                if os.fstat(fd.fileno()).st_size == 0:
+                    return None
+                return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError):
+            return None
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, num):
+        return RECORD.unpack_from(self.log, num * RECORD.size)
+
+    def recordsFrom(self, day):
+        """The number of the first record on or after a day."""
+        pos = bisect.bisect_left(self.days, day)
+        return self.firsts[pos] if pos < len(self.firsts) else self.count
+
+    def events(self, first, last):
+        """(time, code, stand, seconds) for each event between two days, inclusive."""
+        for num in range(self.recordsFrom(first), self.recordsFrom(last + 1)):
+            yield self[num]
+
+    def totals(self, first, last):
+        """Seconds spent sitting and standing on each day between two day ordinals.
+
+        Returns an ordered {date: {"sit": seconds, "stand": seconds}}.
+        """
+        bounds = [midnight(day) for day in range(first, last + 2)]
+        spent = {"sit": [0.0] * (last + 1 - first), "stand": [0.0] * (last + 1 - first)}
+        begin, end = bounds[0], bounds[-1]
+        lo, hi = self.recordsFrom(first), self.recordsFrom(last + 1)
+        # Walk back to the start of the phase that was running at `begin`.
+        while lo > 0 and self[lo - 1][1] != START:
+            lo -= 1
+        lo = max(0, lo - 1)
+
+        # A phase runs until the next event, but never past its own length
+        # (or, after a resume, the time it had left): a session that ended
+        # without a stop record does not count on into the next one.
+        since = until = phase = None
+        for num in range(lo, hi):
+            stamp, code, stand, seconds = self[num]
+            if since is not None:
+                self.add(bounds, phase, max(since, begin), min(stamp, until, end))
+                since = None
+            if code in (START, RESUME):
+                since, until = stamp, stamp + seconds
+                phase = spent["stand" if stand else "sit"]
+        if since is not None:
+            self.add(bounds, phase, max(since, begin), min(time.time(), until, end))
+        return collections.OrderedDict(
+            (datetime.date.fromordinal(first + num),
+             {"sit": spent["sit"][num], "stand": spent["stand"][num]})
+            for num in range(last + 1 - first))
+
+    @staticmethod
+    def add(bounds, spent, start, stop):
+        """Add the time from start to stop to `spent`, split at the day `bounds`."""
+        day = bisect.bisect_right(bounds, start) - 1
+        while start < stop:
+            until = min(stop, bounds[day + 1])
+            spent[day] += until - start
+            start = until
+            day += 1
+
+    def standingMinutes(self, days=365, today=None):
+        """Minutes stood on each of the last `days` days, oldest first."""
+        today = today or datetime.date.today().toordinal()
+        totals = self.totals(today - days + 1, today)
+        return collections.OrderedDict(
+            (date, spent["stand"] / 60.0) for date, spent in totals.items())
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
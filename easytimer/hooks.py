@@ -0,0 +1,252 @@
+import collections
+import logging
+import os
+import subprocess
+from threading import Condition, Thread, Timer
+
+from easytimer.engine import EVENTS
+from easytimer.metrics import NullMetrics
+from easytimer.scheduler import monotonic
+
+logger = logging.getLogger(__name__)
+
+HOOK_WORKERS = 4
+HOOK_TIMEOUT = 30.0
+BACKOFF = 5.0
+BACKOFF_MAX = 600.0
+
+# Other names the "hooks" config accepts for engine events.
+ALIASES = {"cancel": "stop"}
+
+TEXT = type(u"")
+
+
+def native(value):
+    """`value` as a native string for argv and the environment: UTF-8 bytes on Python 2."""
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, TEXT):
+        value = TEXT(value)
+    return value if str is TEXT else value.encode("utf-8")
+
+
+class Hook(object):
+    """A command run on a timer event, from one entry of the "hooks" config.
+
+    `cmd` and the values of `env` are templates over the event context
+    (see `context`).  At most `concurrency` runs happen at once; up to
+    `queue` more wait, the oldest giving way to newer ones.  After a run
+    fails (or times out) the hook is skipped for `backoff` seconds, twice
+    as long after each further failure, up to `backoffMax`.
+    """
+    def __init__(self, event, cmd, env=None, timeout=HOOK_TIMEOUT, concurrency=1, queue=1,
+                 backoff=BACKOFF, backoffMax=BACKOFF_MAX, name=None):
+        self.event = event
+        self.cmd = list(cmd)
+        self.env = dict(env or {})
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.queue = max(1, queue)
+        self.backoff = backoff
+        self.backoffMax = backoffMax
+        self.name = name or os.path.basename(self.cmd[0])
+        self.pending = collections.deque()
+        self.running = 0
+        self.failures = 0
+        self.retryAt = 0.0
+
+    def render(self, context):
+        """The command line and extra environment for one event."""
+        return ([native(TEXT(arg).format(**context)) for arg in self.cmd],
+                dict((native(key), native(TEXT(value).format(**context)))
+                     for key, value in self.env.items()))
+
+    def failed(self, now):
+        self.failures += 1
+        self.retryAt = now + min(self.backoffMax, self.backoff * 2 ** (self.failures - 1))
+
+
+def makeHook(event, spec):
+    if isinstance(spec, list):
+        spec = {"cmd": spec}
+    return Hook(event, spec["cmd"], env=spec.get("env"),
+                timeout=spec.get("timeout", HOOK_TIMEOUT),
+                concurrency=spec.get("concurrency", 1),
+                queue=spec.get("queue", 1),
+                backoff=spec.get("backoff", BACKOFF),
+                backoffMax=spec.get("backoff_max", BACKOFF_MAX),
+                name=spec.get("name"))
+
+
+def context(event, engine):
+    """What hook templates can refer to; also passed as EASYTIMER_* variables."""
+    phase = engine.phase
+    return {
+        "event": event,
+        "timer": getattr(engine, 'name', "default"),
+        "phase": phase.name if phase else "",
+        "msg": engine.msg or "",
+        "stand": int(engine.stand),
+        "minutes": engine.minutes(),
+        "remaining": int(engine.remaining()),
+        "number": getattr(engine, 'number', 0),
+        "paused": int(engine.paused),
+    }
+
+
+class Hooks(object):
+    """Runs hook commands on a small pool of worker threads.
+
+    `fire` only queues, so the countdown never waits for a hook, and
+    workers pick whichever queued hook is below its concurrency limit, so
+    a slow hook holds up at most its own later runs.  Workers are started
+    as needed, up to `workers`.
+    """
+    def __init__(self, hooks, workers=HOOK_WORKERS, metrics=None, clock=monotonic):
+        self.hooks = list(hooks)
+        self.byEvent = collections.defaultdict(list)
+        for hook in self.hooks:
+            self.byEvent[hook.event].append(hook)
+        self.maxWorkers = max(1, workers)
+        self.metrics = metrics if metrics is not None else NullMetrics()
+        self.clock = clock
+        self.cond = Condition()
+        self.workers = []
+        self.idle = 0
+        self.closed = False
+        self.runs = self.failures = self.skipped = self.dropped = 0
+
+    def __len__(self):
+        return len(self.hooks)
+
+    def running(self):
+        with self.cond:
+            return sum(hook.running for hook in self.hooks)
+
+    def listener(self, event, engine):
+        """An engine listener."""
+        if self.byEvent.get(event):
+            self.fire(event, context(event, engine))
+
+    def fire(self, event, values):
+        now = self.clock()
+        with self.cond:
+            if self.closed:
+                return
+            for hook in self.byEvent.get(event, ()):
+                if now < hook.retryAt:
+                    self.skipped += 1
+                    self.metrics.count("hooks_skipped")
+                    continue
+                if len(hook.pending) >= hook.queue:
+                    hook.pending.popleft()
+                    self.dropped += 1
+                    self.metrics.count("hooks_dropped")
+                hook.pending.append((values, now))
+            if not self.idle and len(self.workers) < self.maxWorkers:
+                worker = Thread(target=self.run, name="Hooks")
+                worker.daemon = True
+                self.workers.append(worker)
+                worker.start()
+            self.cond.notify()
+
+    def next(self):
+        """A (hook, values, queued) that may run now, or None; call with the lock held."""
+        for hook in self.hooks:
+            if hook.pending and hook.running < hook.concurrency:
+                hook.running += 1
+                values, queued = hook.pending.popleft()
+                return hook, values, queued
+        return None
+
+    def run(self):
+        while True:
+            with self.cond:
+                job = self.next()
+                while job is None and not self.closed:
+                    self.idle += 1
+                    self.cond.wait()
+                    self.idle -= 1
+                    job = self.next()
+                if self.closed:
+                    return
+            hook, values, queued = job
+            started = self.clock()
+            ok = False
+            try:
+                ok = self.execute(hook, values)
+            except Exception:
+                logger.exception("Hook %s for %s failed", hook.name, hook.event)
+            finally:
+                # However the run ended, the hook must be free to run again.
+                with self.cond:
+                    hook.running -= 1
+                    self.runs += 1
+                    self.metrics.observe("hook_wait_seconds", started - queued)
+                    self.metrics.observe("hook_run_seconds", self.clock() - started)
+                    if ok:
+                        hook.failures = 0
+                    else:
+                        self.failures += 1
+                        self.metrics.count("hooks_failed")
+                        hook.failed(self.clock())
+                        hook.pending.clear()
+                    self.cond.notify()
+
+    def execute(self, hook, values):
+        """Run one hook to completion (or its timeout); returns whether it succeeded."""
+        try:
+            cmd, env = hook.render(values)
+        except (KeyError, IndexError, ValueError) as exc:
+            logger.warning("Bad template in hook %s: %s", hook.name, exc)
+            return False
+        env.update(("EASYTIMER_" + key.upper(), native(value)) for key, value in values.items())
+        try:
+            with open(os.devnull) as rd:
+                with open(os.devnull, 'wb') as wr:
+                    proc = subprocess.Popen(cmd, stdin=rd, stdout=wr, stderr=wr, close_fds=True,
+                                            env=dict(os.environ, **env))
+        except OSError as exc:
+            logger.warning("Cannot run hook %s: %s", hook.name, exc)
+            return False
+        killer = Timer(hook.timeout, self.kill, (hook, proc))
+        killer.daemon = True
+        killer.start()
+        try:
+            status = proc.wait()
+        finally:
+            killer.cancel()
+        if status != 0:
+            logger.warning("Hook %s for %s exited with %s", hook.name, hook.event, status)
+        return status == 0
+
+    @staticmethod
+    def kill(hook, proc):
+        logger.warning("Hook %s timed out after %ss", hook.name, hook.timeout)
+        try:
+            proc.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        """Drop whatever is queued; hooks already running are left to finish."""
+        with self.cond:
+            self.closed = True
+            for hook in self.hooks:
+                hook.pending.clear()
+            self.cond.notify_all()
+
+
+def makeHooks(config, metrics=None):
+    """Hooks for the "hooks" config: {event: [command or {"cmd": ..., ...}, ...]}."""
+    hooks = []
+    for event, specs in sorted((config.get('hooks') or {}).items()):
+        event = ALIASES.get(event, event)
+        if event not in EVENTS:
+            raise ValueError("Unknown hook event %r (not one of %s)" % (event, ", ".join(EVENTS)))
+        for spec in specs:
+            try:
+                hooks.append(makeHook(event, spec))
+            except (KeyError, TypeError, IndexError) as exc:
+                raise ValueError("Bad hook for %s: %s" % (event, exc))
+    return Hooks(hooks, workers=config.get('hook_workers') or HOOK_WORKERS, metrics=metrics)
@@ -0,0 +1,87 @@
+import collections
+import math
+
+from PyQt4 import QtGui, QtCore
+
+RING_STEPS = 60
+RING_SIZE = 32
+RING_COLOR = "#2e7d32"
+
+
+class IconSet(object):
+    """QIcons for a list of image files, each one loaded on first use."""
+    def __init__(self, names):
+        self.names = names
+        self.icons = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, ind):
+        ind %= len(self.names)
+        icon = self.icons.get(ind)
+        if icon is None:
+            icon = self.icons[ind] = QtGui.QIcon(self.names[ind])
+        return icon
+
+
+class RingIcons(object):
+    """Tray icons showing the fraction of the phase left as a ring around a glyph.
+
+    The fraction is quantized to `steps`, and every frame is drawn once per
+    glyph and size; after that a frame is a dictionary lookup.  The least
+    recently used frames are evicted beyond `maxFrames`.
+    """
+    def __init__(self, steps=RING_STEPS, size=RING_SIZE, color=RING_COLOR, maxFrames=None):
+        self.steps = steps
+        self.size = size
+        self.color = QtGui.QColor(color)
+        self.maxFrames = maxFrames or 4 * (steps + 1)
+        self.frames = collections.OrderedDict()
+        self.rendered = 0
+
+    def step(self, fraction):
+        # The tolerance keeps float noise at a step boundary from rounding up.
+        return int(math.ceil(min(max(fraction, 0.0), 1.0) * self.steps - 1e-9))
+
+    def nextChange(self, deadline, length, fraction):
+        """When the frame for a phase of `length` seconds ending at `deadline` changes."""
+        step = self.step(fraction)
+        if step <= 1:
+            # The last frame lasts until the phase itself ends.
+            return None
+        return deadline - (step - 1) * float(length) / self.steps
+
+    def frame(self, glyph, name, fraction):
+        key = (name, self.size, self.step(fraction))
+        icon = self.frames.pop(key, None)
+        if icon is None:
+            icon = self.render(glyph, key[2])
+            while len(self.frames) >= self.maxFrames:
+                self.frames.popitem(last=False)
+        self.frames[key] = icon
+        return icon
+
+    def prerender(self, glyph, name):
+        for step in range(self.steps + 1):
+            self.frame(glyph, name, float(step) / self.steps)
+
+    def render(self, glyph, step):
+        self.rendered += 1
+        size = self.size
+        pixmap = QtGui.QPixmap(glyph.pixmap(size, size))
+        if pixmap.isNull():
+            pixmap = QtGui.QPixmap(size, size)
+            pixmap.fill(QtCore.Qt.transparent)
+        width = max(2, size // 8)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        pen = QtGui.QPen(self.color)
+        pen.setWidth(width)
+        pen.setCapStyle(QtCore.Qt.FlatCap)
+        painter.setPen(pen)
+        rect = QtCore.QRectF(width / 2.0, width / 2.0, size - width, size - width)
+        # Angles are in 1/16th of a degree, clockwise from twelve o'clock.
+        painter.drawArc(rect, 90 * 16, -int(360 * 16 * step / self.steps))
+        painter.end()
+        return QtGui.QIcon(pixmap)
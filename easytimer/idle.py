@@ -0,0 +1,346 @@
+"""Tells when the user is away: idle, behind a locked screen or suspended.
+
+Every source here is an event source the owner watches like the control
+socket, calling `read()` whenever `fileno()` is readable (and forgetting
+the source once `read()` returns False), so noticing that the user left
+costs no wakeups at all:
+
+- `XIdleAlarm` asks the X server, through the SYNC extension's IDLETIME
+  counter, for an event when input has been idle for a while and another
+  when input comes back.
+- `DBusSignals` follows screen saver and logind signals (lock, unlock,
+  suspend) through a dbus-monitor child process.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import subprocess
+
+from easytimer.notify import which
+
+logger = logging.getLogger(__name__)
+
+# The SYNC extension's alarm attributes and tests (X11/extensions/sync.h).
+XSyncCACounter = 1 << 0
+XSyncCAValueType = 1 << 1
+XSyncCAValue = 1 << 2
+XSyncCATestType = 1 << 3
+XSyncCADelta = 1 << 4
+XSyncCAEvents = 1 << 5
+XSyncAbsolute = 0
+XSyncPositiveTransition = 0
+XSyncNegativeTransition = 1
+XSyncAlarmNotify = 1
+
+
+class XSyncValue(ctypes.Structure):
+    _fields_ = [("hi", ctypes.c_int), ("lo", ctypes.c_uint)]
+
+    @classmethod
+    def of(cls, value):
+        return cls(value >> 32, value & 0xffffffff)
+
+    def __int__(self):
+        return (self.hi << 32) | self.lo
+
+
+class XSyncSystemCounter(ctypes.Structure):
+    _fields_ = [("name", ctypes.c_char_p), ("counter", ctypes.c_ulong),
+                ("resolution", XSyncValue)]
+
+
+class XSyncTrigger(ctypes.Structure):
+    _fields_ = [("counter", ctypes.c_ulong), ("value_type", ctypes.c_int),
+                ("wait_value", XSyncValue), ("test_type", ctypes.c_int)]
+
+
+class XSyncAlarmAttributes(ctypes.Structure):
+    _fields_ = [("trigger", XSyncTrigger), ("delta", XSyncValue),
+                ("events", ctypes.c_int), ("state", ctypes.c_int)]
+
+
+class XSyncAlarmNotifyEvent(ctypes.Structure):
+    _fields_ = [("type", ctypes.c_int), ("serial", ctypes.c_ulong),
+                ("send_event", ctypes.c_int), ("display", ctypes.c_void_p),
+                ("alarm", ctypes.c_ulong), ("counter_value", XSyncValue),
+                ("alarm_value", XSyncValue), ("time", ctypes.c_ulong),
+                ("state", ctypes.c_int)]
+
+
+class XEvent(ctypes.Union):
+    _fields_ = [("type", ctypes.c_int), ("alarm", XSyncAlarmNotifyEvent),
+                ("pad", ctypes.c_long * 24)]
+
+
+def loadXlib():
+    """libX11 and libXext with the few functions used here declared, or None."""
+    names = ctypes.util.find_library("X11"), ctypes.util.find_library("Xext")
+    if not all(names):
+        return None
+    x11, xext = [ctypes.CDLL(name) for name in names]
+    x11.XOpenDisplay.restype = ctypes.c_void_p
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+    x11.XPending.argtypes = [ctypes.c_void_p]
+    x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+    x11.XFlush.argtypes = [ctypes.c_void_p]
+    xext.XSyncQueryExtension.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                         ctypes.POINTER(ctypes.c_int)]
+    xext.XSyncInitialize.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int),
+                                     ctypes.POINTER(ctypes.c_int)]
+    xext.XSyncListSystemCounters.restype = ctypes.POINTER(XSyncSystemCounter)
+    xext.XSyncListSystemCounters.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_int)]
+    xext.XSyncFreeSystemCounterList.argtypes = [ctypes.POINTER(XSyncSystemCounter)]
+    xext.XSyncCreateAlarm.restype = ctypes.c_ulong
+    xext.XSyncCreateAlarm.argtypes = [ctypes.c_void_p, ctypes.c_ulong,
+                                      ctypes.POINTER(XSyncAlarmAttributes)]
+    return x11, xext
+
+
+class XIdleAlarm(object):
+    """Calls `onIdle(True)` after `seconds` without input on X display `display`,
+    and `onIdle(False)` at the next input; raises OSError if that cannot be done.
+    """
+    def __init__(self, seconds, onIdle, display=None):
+        self.onIdle = onIdle
+        libs = loadXlib()
+        if libs is None:
+            raise OSError("libX11 or libXext is missing")
+        self.x11, xext = libs
+        self.dpy = self.x11.XOpenDisplay(display.encode() if display else None)
+        if not self.dpy:
+            raise OSError("Cannot open display %s" % (display or os.environ.get("DISPLAY")))
+        try:
+            base, error = ctypes.c_int(), ctypes.c_int()
+            if not xext.XSyncQueryExtension(self.dpy, ctypes.byref(base), ctypes.byref(error)):
+                raise OSError("The X server has no SYNC extension")
+            xext.XSyncInitialize(self.dpy, ctypes.byref(ctypes.c_int()),
+                                 ctypes.byref(ctypes.c_int()))
+            self.notify = base.value + XSyncAlarmNotify
+            counter = self.idleCounter(xext)
+            threshold = max(1, int(seconds * 1000))
+            self.idleAlarm = self.alarm(xext, counter, threshold, XSyncPositiveTransition)
+            self.backAlarm = self.alarm(xext, counter, threshold, XSyncNegativeTransition)
+            self.x11.XFlush(self.dpy)
+        except OSError:
+            self.close()
+            raise
+
+    def idleCounter(self, xext):
+        count = ctypes.c_int()
+        counters = xext.XSyncListSystemCounters(self.dpy, ctypes.byref(count))
+        try:
+            for num in range(count.value):
+                if counters[num].name == b"IDLETIME":
+                    return counters[num].counter
+        finally:
+            if counters:
+                xext.XSyncFreeSystemCounterList(counters)
+        raise OSError("The X server has no IDLETIME counter")
+
+    def alarm(self, xext, counter, value, test):
+        attrs = XSyncAlarmAttributes()
+        attrs.trigger.counter = counter
+        attrs.trigger.value_type = XSyncAbsolute
+        attrs.trigger.wait_value = XSyncValue.of(value)
+        attrs.trigger.test_type = test
+        attrs.delta = XSyncValue.of(0)
+        attrs.events = True
+        mask = (XSyncCACounter | XSyncCAValueType | XSyncCAValue | XSyncCATestType |
+                XSyncCADelta | XSyncCAEvents)
+        return xext.XSyncCreateAlarm(self.dpy, mask, ctypes.byref(attrs))
+
+    def fileno(self):
+        return self.x11.XConnectionNumber(self.dpy)
+
+    def read(self):
+        if not self.dpy:
+            return False
+        event = XEvent()
+        while self.x11.XPending(self.dpy):
+            self.x11.XNextEvent(self.dpy, ctypes.byref(event))
+            if event.type == self.notify:
+                if event.alarm.alarm == self.idleAlarm:
+                    self.onIdle(True)
+                elif event.alarm.alarm == self.backAlarm:
+                    self.onIdle(False)
+        return True
+
+    def close(self):
+        if self.dpy:
+            # Closing the connection also destroys the alarms.
+            self.x11.XCloseDisplay(self.dpy)
+            self.dpy = None
+
+
+# What each bus says when the user leaves or comes back; a value of None
+# takes the state from the signal's boolean argument.
+SESSION_SIGNALS = {
+    ("org.freedesktop.ScreenSaver", "ActiveChanged"): ("locked", None),
+    ("org.gnome.ScreenSaver", "ActiveChanged"): ("locked", None),
+    ("org.mate.ScreenSaver", "ActiveChanged"): ("locked", None),
+}
+SYSTEM_SIGNALS = {
+    ("org.freedesktop.login1.Session", "Lock"): ("locked", True),
+    ("org.freedesktop.login1.Session", "Unlock"): ("locked", False),
+    ("org.freedesktop.login1.Manager", "PrepareForSleep"): ("asleep", None),
+}
+
+
+def sessionPath(session=None):
+    """The logind object path of session `session` (default: ours), or None."""
+    session = session or os.environ.get("XDG_SESSION_ID")
+    if not session:
+        return None
+    # As sd_bus_path_encode() does it, a leading digit included.
+    escaped = "".join(char if char.isalnum() and not (num == 0 and char.isdigit())
+                      else "_%02x" % ord(char) for num, char in enumerate(session))
+    return "/org/freedesktop/login1/session/" + escaped
+
+
+class DBusSignals(object):
+    """Calls `onChange(reason, away)` for the `signals` seen on `bus` ("session" or "system").
+
+    The signals are followed through "dbus-monitor", whose output is read
+    as it comes; raises OSError if it cannot be started.
+    """
+    def __init__(self, bus, signals, onChange, path=None):
+        self.signals = signals
+        self.onChange = onChange
+        self.path = path
+        rules = []
+        for interface, member in sorted(signals):
+            rule = "type='signal',interface='%s',member='%s'" % (interface, member)
+            if path and interface.endswith(".Session"):
+                rule += ",path='%s'" % path
+            rules.append(rule)
+        with open(os.devnull, 'wb') as wr:
+            self.proc = subprocess.Popen(["dbus-monitor", "--" + bus] + rules,
+                                         stdout=subprocess.PIPE, stderr=wr, close_fds=True)
+        self.fd = self.proc.stdout.fileno()
+        self.data = b''
+        self.waiting = None
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        if self.proc is None:
+            return False
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as exc:
+            if exc.errno in (errno.EAGAIN, errno.EINTR):
+                return True
+            raise
+        if not data:
+            logger.info("dbus-monitor exited with %s", self.proc.wait())
+            self.close()
+            return False
+        self.data += data
+        lines = self.data.split(b'\n')
+        self.data = lines.pop()
+        for line in lines:
+            self.parse(line.decode("utf-8", "replace").strip())
+        return True
+
+    def parse(self, line):
+        if line.startswith("signal "):
+            fields = dict(part.split("=", 1) for part in line.replace(";", " ").split()
+                          if "=" in part)
+            key = (fields.get("interface"), fields.get("member"))
+            self.waiting = None
+            if key[0] and key[0].endswith(".Session") and fields.get("path") != self.path:
+                return
+            if key in self.signals:
+                reason, away = self.signals[key]
+                if away is None:
+                    self.waiting = reason
+                else:
+                    self.onChange(reason, away)
+        elif self.waiting and line.startswith("boolean "):
+            self.onChange(self.waiting, line.split()[1] == "true")
+            self.waiting = None
+
+    def close(self):
+        if self.proc is not None:
+            if self.proc.poll() is None:
+                self.proc.terminate()
+                self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+
+
+class AwayMonitor(object):
+    """Calls `onAway(away)` when the user leaves and when they are back.
+
+    They are away while any of the reasons holds: no input for `idle`
+    seconds (0 to not watch input), the screen locked or the machine
+    suspending (if `lock`).  `sources` are what the owner has to watch.
+    """
+    def __init__(self, onAway, idle=0, lock=True, display=None):
+        self.onAway = onAway
+        self.reasons = set()
+        self.sources = []
+        if idle > 0 and not (display or os.environ.get("DISPLAY")):
+            logger.info("Not pausing when idle: there is no display")
+        elif idle > 0:
+            try:
+                self.sources.append(XIdleAlarm(idle, lambda away: self.change("idle", away),
+                                               display))
+            except OSError as exc:
+                logger.warning("Not pausing when idle: %s", exc)
+        if lock:
+            if which("dbus-monitor") is None:
+                logger.warning("Not pausing when locked: dbus-monitor is not installed")
+                return
+            ours = sessionPath()
+            system = SYSTEM_SIGNALS
+            if ours is None:
+                # Without our session's path, every user's lock would match.
+                logger.info("Not following logind locks: XDG_SESSION_ID is not set")
+                system = dict((key, value) for key, value in SYSTEM_SIGNALS.items()
+                              if not key[0].endswith(".Session"))
+            for bus, signals, path in (("session", SESSION_SIGNALS, None),
+                                       ("system", system, ours)):
+                try:
+                    self.sources.append(DBusSignals(bus, signals, self.change, path))
+                except OSError as exc:
+                    logger.warning("Cannot follow the %s bus: %s", bus, exc)
+
+    def __len__(self):
+        return len(self.sources)
+
+    @property
+    def away(self):
+        return bool(self.reasons)
+
+    def change(self, reason, away):
+        was = self.away
+        if away:
+            self.reasons.add(reason)
+        else:
+            self.reasons.discard(reason)
+        logger.info("%s: %s", reason, away)
+        if self.away != was:
+            self.onAway(self.away)
+
+    def close(self):
+        for source in self.sources:
+            source.close()
+        self.sources = []
+
+
+AWAY_KEYS = ("idle_pause", "lock_pause")
+
+
+def makeAway(config, onAway):
+    """An AwayMonitor for the "idle_pause" and "lock_pause" settings, or None if both are off."""
+    idle = config.get('idle_pause') or 0
+    lock = config.get('lock_pause')
+    if not (idle > 0 or lock):
+        return None
+    return AwayMonitor(onAway, idle=idle, lock=lock)
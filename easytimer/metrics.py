@@ -0,0 +1,160 @@
+import bisect
+import json
+import logging
+import os
+import tempfile
+import time
+from functools import wraps
+
+from easytimer.scheduler import monotonic
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the histogram buckets.
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+PREFIX = "easytimer_"
+
+
+class Histogram(object):
+    """Counts of observed values per bucket, as Prometheus reports them."""
+    def __init__(self, buckets=BUCKETS):
+        self.bounds = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        """Cumulative counts per bucket, labelled by their upper bound as in Prometheus."""
+        cumulative, total = [], 0
+        for bound, count in zip([repr(bound) for bound in self.bounds] + ["+Inf"], self.counts):
+            total += count
+            cumulative.append([bound, total])
+        return {"count": self.count, "sum": self.sum, "buckets": cumulative}
+
+
+class Metrics(object):
+    """Counters, gauges and latency histograms of a running timer.
+
+    Each metric is only ever updated from one thread (the sound worker has
+    its own), so none of this locks.  Values that the timer keeps anyway
+    (scheduler wakeups, tray pushes and so on) are not recorded here but
+    read by the `collect` callbacks whenever a snapshot is taken.
+    """
+    enabled = True
+
+    def __init__(self, clock=monotonic):
+        self.clock = clock
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+
+    def count(self, name, num=1):
+        self.counters[name] = self.counters.get(name, 0) + num
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(value)
+
+    def timed(self, name, func):
+        """`func`, observing how long each call takes as `name`."""
+        clock = self.clock
+
+        @wraps(func)
+        def timedFunc(*args, **kwargs):
+            started = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(name, clock() - started)
+        return timedFunc
+
+    def collect(self, collector):
+        """Call `collector()` for a dict of gauges on every snapshot."""
+        self.collectors.append(collector)
+
+    def snapshot(self):
+        gauges = {}
+        for collector in self.collectors:
+            gauges.update(collector())
+        return {
+            "counters": dict(self.counters),
+            "gauges": gauges,
+            "histograms": dict((name, histogram.snapshot())
+                               for name, histogram in list(self.histograms.items())),
+        }
+
+
+class NullMetrics(Metrics):
+    """What the timer records with when statistics are off: nothing.
+
+    `timed` hands back the function itself, so timed code pays no cost at
+    all, and the cheap always-available collected gauges are still reported.
+    """
+    enabled = False
+
+    def count(self, name, num=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def timed(self, name, func):
+        return func
+
+
+def prometheus(snapshot):
+    """A snapshot in the Prometheus text exposition format."""
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        lines += ["# TYPE %s%s counter" % (PREFIX, name), "%s%s %s" % (PREFIX, name, value)]
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines += ["# TYPE %s%s gauge" % (PREFIX, name), "%s%s %s" % (PREFIX, name, value)]
+    for name, histogram in sorted(snapshot["histograms"].items()):
+        name = PREFIX + name
+        lines.append("# TYPE %s histogram" % name)
+        for le, count in histogram["buckets"]:
+            lines.append('%s_bucket{le="%s"} %d' % (name, le, count))
+        lines += ["%s_sum %r" % (name, histogram["sum"]),
+                  "%s_count %d" % (name, histogram["count"])]
+    return "\n".join(lines) + "\n"
+
+
+def render(snapshot, path):
+    """The snapshot as JSON if `path` ends in .json, otherwise as Prometheus text."""
+    return json.dumps(snapshot, sort_keys=True) if path.endswith(".json") else prometheus(snapshot)
+
+
+def writeStats(metrics, path):
+    """Atomically replace `path` with a snapshot, for node exporters and the like."""
+    temp = None
+    try:
+        fd, temp = tempfile.mkstemp(prefix=".easytimer.", dir=os.path.dirname(path) or ".")
+        with os.fdopen(fd, 'w') as wr:
+            wr.write(render(metrics.snapshot(), path))
+        os.rename(temp, path)
+    except (IOError, OSError):
+        logger.exception("Cannot write %s", path)
+        if temp is not None and os.path.exists(temp):
+            os.remove(temp)
+
+
+def wallDrift():
+    """A collector of how far the wall clock moved against the monotonic one.
+
+    NTP steps, manual clock changes and (on some systems) suspends show up
+    here; the timer itself only runs on the monotonic clock.
+    """
+    startWall, startMono = time.time(), monotonic()
+    return lambda: {"wall_drift_seconds": (time.time() - startWall) - (monotonic() - startMono)}
+
+
+def makeMetrics(config):
+    return Metrics() if config.get('stats') else NullMetrics()
@@ -0,0 +1,57 @@
+import logging
+import os
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_MODES = ("auto", "desktop", "tray", "popup")
+
+
+def which(name):
+    """The full path of an executable on the PATH, or None."""
+    if os.path.dirname(name):
+        return name if os.access(name, os.X_OK) else None
+    for folder in os.environ.get("PATH", os.defpath).split(os.pathsep):
+        path = os.path.join(folder, name)
+        if os.path.isfile(path) and os.access(path, os.X_OK):
+            return path
+    return None
+
+
+class CommandNotifier(object):
+    """Desktop notifications through a command such as notify-send.
+
+    The command is started without waiting for it; finished ones are reaped
+    on the next notification, so at most a few processes are ever left over.
+    Arguments may use {title}, {text} and {ms} (the timeout in milliseconds,
+    0 for a notification that stays until dismissed).
+    """
+    def __init__(self, cmd):
+        self.cmd = list(cmd)
+        self.running = []
+        self.sent = 0
+
+    @classmethod
+    def available(cls, cmd):
+        return bool(cmd) and which(cmd[0]) is not None
+
+    def notify(self, title, text, timeout=None):
+        self.reap()
+        ms = int((timeout or 0) * 1000)
+        args = [arg.format(title=title, text=text, ms=ms) for arg in self.cmd]
+        try:
+            with open(os.devnull, 'wb') as devnull:
+                self.running.append(subprocess.Popen(
+                    args, stdout=devnull, stderr=devnull, close_fds=True))
+            self.sent += 1
+            return True
+        except OSError:
+            logger.exception("Cannot notify with: %s", args[0])
+            return False
+
+    def reap(self):
+        self.running = [proc for proc in self.running if proc.poll() is None]
+
+    def live(self):
+        self.reap()
+        return len(self.running)
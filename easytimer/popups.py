@@ -0,0 +1,93 @@
+from PyQt4 import QtGui, QtCore
+
+POOL_SIZE = 3
+
+
+class Popup(QtGui.QMessageBox):
+    """A non-modal message box that can be shown again and again."""
+    def __init__(self):
+        QtGui.QMessageBox.__init__(self)
+        self.setWindowModality(QtCore.Qt.NonModal)
+        self.setIcon(QtGui.QMessageBox.Information)
+        self.setStandardButtons(QtGui.QMessageBox.Ok)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.connect(self.timer, QtCore.SIGNAL("timeout()"), self.dismiss)
+        self.connect(self, QtCore.SIGNAL("finished(int)"), self.timer.stop)
+        self.key = None
+
+    def present(self, title, text, timeout=None):
+        self.key = (title, text)
+        self.setWindowTitle(title)
+        self.setText(text)
+        if timeout:
+            self.timer.start(int(timeout * 1000))
+        else:
+            self.timer.stop()
+        self.show()
+        self.raise_()
+
+    def dismiss(self):
+        self.done(QtGui.QMessageBox.Ok)
+
+
+class PopupPool(object):
+    """Shows messages in at most `size` reusable non-modal popups.
+
+    Nothing here blocks the event loop, and popups are created on first
+    need and then only ever hidden and shown again.  A message that is
+    already showing just has its timeout restarted; beyond `size` messages
+    the longest-shown popup is reused.
+    """
+    def __init__(self, size=POOL_SIZE):
+        self.size = max(1, size)
+        self.popups = []
+        self.created = 0
+
+    def notify(self, title, text, timeout=None):
+        visible = [popup for popup in self.popups if popup.isVisible()]
+        popup = next((popup for popup in visible if popup.key == (title, text)), None)
+        if popup is None:
+            popup = next((popup for popup in self.popups if not popup.isVisible()), None)
+        if popup is None and len(self.popups) < self.size:
+            popup = Popup()
+            self.created += 1
+        if popup is None:
+            popup = self.popups[0]
+        if popup in self.popups:
+            self.popups.remove(popup)
+        # The most recently shown popup is kept last.
+        self.popups.append(popup)
+        popup.present(title, text, timeout)
+        return True
+
+    def resize(self, size):
+        """Keep at most `size` popups from now on; hidden ones beyond that are let go."""
+        self.size = max(1, size)
+        for popup in [popup for popup in self.popups if not popup.isVisible()]:
+            if len(self.popups) <= self.size:
+                break
+            self.popups.remove(popup)
+            popup.deleteLater()
+
+    def live(self):
+        return sum(1 for popup in self.popups if popup.isVisible())
+
+
+class TrayNotifier(object):
+    """Messages as balloons from the tray icon, where the tray supports them."""
+    def __init__(self, trayIcon):
+        self.trayIcon = trayIcon
+
+    @staticmethod
+    def available():
+        return QtGui.QSystemTrayIcon.supportsMessages()
+
+    def notify(self, title, text, timeout=None):
+        # Balloons cannot stay up until dismissed, so those get 10 seconds.
+        self.trayIcon.showMessage(title, text, QtGui.QSystemTrayIcon.Information,
+                                  int((timeout or 10) * 1000))
+        return True
+
+    def live(self):
+        return 0
@@ -0,0 +1,86 @@
+import math
+
+
+class Presenter(object):
+    """Pushes the tray tooltip and icon only when what the user sees changes.
+
+    Every push to a tray icon is a round trip to the tray host, so updates are
+    diffed against what was last pushed, and batched: with a `defer` callable
+    (which should arrange for `flush` to run soon, once) any number of updates
+    in one pass of the event loop result in at most one push of each.
+    """
+    def __init__(self, getText, setToolTip, setIcon, defer=None, quantum=1):
+        self.getText = getText
+        self.push = {'tip': setToolTip, 'icon': setIcon}
+        self.defer = defer
+        self.quantum = quantum
+        self.templates = {}
+        self.state = {}
+        self.shown = {}
+        self.pending = False
+        self.pushes = 0
+        self.skipped = 0
+
+    def template(self, key):
+        """The compiled (bound `format`) template for a text key."""
+        fmt = self.templates.get(key)
+        if fmt is None:
+            fmt = self.templates[key] = self.getText(key).format
+        return fmt
+
+    def reset(self):
+        """Forget the compiled templates, after the texts changed."""
+        self.templates.clear()
+        self.state.pop('tipKey', None)
+
+    def minutes(self, sec):
+        """The minutes left, rounded up to what the tooltip can display."""
+        quantum = self.quantum
+        return math.ceil(sec / 60.0 / quantum - 1e-9) * quantum
+
+    def tooltip(self, sec, act, paused, others=()):
+        """The main timer's tip, then a line for each (name, sec, act, paused) in `others`."""
+        mins = self.minutes(sec) if sec > 0 else 0
+        rows = tuple((name, self.minutes(left), what, stopped)
+                     for name, left, what, stopped in others)
+        tipKey = (mins, act, paused, rows)
+        if tipKey == self.state.get('tipKey'):
+            return
+        self.state['tipKey'] = tipKey
+        key = "tip_inactive" if mins <= 0 else "tip_active"
+        msg = self.template(key)(mins=mins, act=act)
+        if paused:
+            msg += '\n' + self.template('text_paused')()
+        for name, left, what, stopped in rows:
+            msg += '\n' + self.template('tip_timer')(name=name, mins=left, act=what)
+            if stopped:
+                msg += ' ' + self.template('text_paused')()
+        self.update('tip', msg)
+
+    def icon(self, icon):
+        self.update('icon', icon)
+
+    def update(self, what, value):
+        self.state[what] = value
+        if self.defer is None:
+            self.flushOne(what)
+        elif not self.pending:
+            self.pending = True
+            self.defer()
+
+    def flush(self):
+        self.pending = False
+        for what in ('icon', 'tip'):
+            if what in self.state:
+                self.flushOne(what)
+
+    def flushOne(self, what):
+        value = self.state[what]
+        # Icons are compared by identity; each distinct one is a cached object.
+        if what in self.shown and (self.shown[what] is value or
+                                   (what == 'tip' and self.shown[what] == value)):
+            self.skipped += 1
+            return
+        self.shown[what] = value
+        self.pushes += 1
+        self.push[what](value)
@@ -0,0 +1,108 @@
+import bisect
+import collections
+
+Phase = collections.namedtuple("Phase", "name seconds msg sound icon stand")
+
+
+def seconds(minutes, what):
+    """`minutes` (a number, or a string of one) in seconds; ValueError unless above 0."""
+    try:
+        value = float(minutes)
+    except (TypeError, ValueError):
+        raise ValueError("%s must be a number of minutes, not %r" % (what, minutes))
+    if not 0 < value < float("inf"):
+        raise ValueError("%s must be longer than 0 minutes, not %r" % (what, minutes))
+    return value * 60
+
+
+def makePhase(spec, name=None):
+    icon = spec.get("icon", "sit")
+    name = spec.get("name", name)
+    return Phase(name=name,
+                 seconds=seconds(spec.get("min", 1), "The length of %s" % name),
+                 msg=spec.get("msg", ""),
+                 sound=spec.get("sound", ""),
+                 icon=icon,
+                 stand=bool(spec.get("stand", icon == "stand")))
+
+
+class Timeline(object):
+    """A program compiled to its phases and their cumulative start offsets.
+
+    One period is `cycles` rounds of the phases followed by the long break,
+    if any; the period runs `repeat` times, or forever if that is 0.
+    Timelines are immutable, and finding the phase at any point is a
+    binary search over the offsets of a single period.
+    """
+    def __init__(self, phases, cycles=1, longBreak=None, repeat=0):
+        period = list(phases) * max(1, cycles)
+        if longBreak is not None:
+            period.append(longBreak)
+        offsets = [0.0]
+        for phase in period:
+            offsets.append(offsets[-1] + phase.seconds)
+        self.phases = tuple(period)
+        self.offsets = tuple(offsets)
+        self.period = offsets[-1]
+        self.repeat = repeat
+        if self.period <= 0:
+            raise ValueError("A program needs at least one phase longer than 0 minutes")
+
+    def __len__(self):
+        """The number of phases in the whole program, or 0 if it never ends."""
+        return len(self.phases) * self.repeat
+
+    def phase(self, number):
+        """The `number`th phase since the start, counting across periods."""
+        return self.phases[number % len(self.phases)]
+
+    def offset(self, number):
+        """When the `number`th phase starts, in seconds from the start."""
+        cycle, index = divmod(number, len(self.phases))
+        return cycle * self.period + self.offsets[index]
+
+    def finished(self, number):
+        return self.repeat > 0 and number >= len(self)
+
+    def locate(self, elapsed):
+        """(phase number, seconds left in it) at `elapsed` seconds from the start.
+
+        The phase number is None once a program that does not repeat forever is over.
+        """
+        cycle, into = divmod(max(0.0, elapsed), self.period)
+        index = min(bisect.bisect_right(self.offsets, into) - 1, len(self.phases) - 1)
+        number = int(cycle) * len(self.phases) + index
+        if self.finished(number):
+            return None, 0.0
+        return number, self.offsets[index + 1] - into
+
+    def first(self, stand):
+        """The number of the first phase that is (or isn't) a standing one."""
+        for number, phase in enumerate(self.phases):
+            if phase.stand == stand:
+                return number
+        return 0
+
+
+def compileProgram(config):
+    """The Timeline for the config's "program", or the plain sit/stand cycle."""
+    name = config.get("program")
+    try:
+        spec = (config.get("programs") or {}).get(name) if name else None
+    except (TypeError, AttributeError) as exc:
+        raise ValueError("Bad program %r: %s" % (name, exc))
+    if not spec:
+        return Timeline([
+            Phase("sitting", seconds(config["sitting_min"], "sitting_min"), config["sitting_msg"],
+                  config.get("sitting_sound", ""), "sit", False),
+            Phase("standing", seconds(config["standing_min"], "standing_min"),
+                  config["standing_msg"], config.get("standing_sound", ""), "stand", True),
+        ])
+    try:
+        phases = [makePhase(phase, "phase%d" % num) for num, phase in enumerate(spec["phases"])]
+        longBreak = spec.get("long_break")
+        return Timeline(phases, cycles=int(spec.get("cycles", 1)),
+                        longBreak=makePhase(longBreak, "long_break") if longBreak else None,
+                        repeat=int(spec.get("repeat", 0)))
+    except (KeyError, TypeError, AttributeError, ValueError) as exc:
+        raise ValueError("Bad program %r: %s" % (name, exc))
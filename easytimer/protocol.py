@@ -0,0 +1,51 @@
+"""Newline-delimited JSON messages exchanged over local sockets.
+
+Requests carry a "cmd" and an "id" that is echoed in the reply; messages
+pushed without being asked for carry an "event" instead.
+"""
+import json
+import os
+import tempfile
+
+DAEMON_SOCKET = os.path.join(tempfile.gettempdir(), "easytimer-daemon.sock")
+
+# No message comes anywhere near this; a peer sending more without a
+# newline is not speaking the protocol.
+MAX_LINE = 1024 * 1024
+
+# What decoded JSON strings can be, on Python 2 and 3.
+STRINGS = (type(u""), type(""))
+
+
+def encode(msg):
+    return (json.dumps(msg, sort_keys=True) + "\n").encode("utf-8")
+
+
+class LineBuffer(object):
+    """Splits a byte stream into decoded messages.
+
+    Raises ValueError if more than `limit` bytes arrive without a newline.
+    """
+    def __init__(self, limit=MAX_LINE):
+        self.data = b''
+        self.limit = limit
+
+    def feed(self, data):
+        self.data += data
+        if b'\n' not in data:
+            lines = []
+        else:
+            lines = self.data.split(b'\n')
+            self.data = lines.pop()
+        if len(self.data) > self.limit:
+            self.data = b''
+            raise ValueError("Line longer than %d bytes" % self.limit)
+        if not lines:
+            return []
+        messages = []
+        for line in lines:
+            try:
+                messages.append(json.loads(line.decode("utf-8")))
+            except ValueError:
+                pass
+        return messages
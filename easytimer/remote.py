@@ -0,0 +1,151 @@
+import itertools
+import logging
+import select
+import socket
+
+from easytimer.engine import CONFIG_KEYS
+from easytimer.program import Phase, compileProgram
+from easytimer.protocol import LineBuffer, encode
+from easytimer.scheduler import monotonic
+
+logger = logging.getLogger(__name__)
+
+# How long the GUI may wait for the daemon to answer a command.
+REQUEST_TIMEOUT = 2.0
+
+
+class RemoteEngine(object):
+    """Stands in for a TimerEngine that is hosted by the timer daemon.
+
+    Commands are sent over the daemon's UNIX socket and answered at once;
+    events pushed by the daemon are delivered to listeners from `readEvents`,
+    which the owner calls whenever `fileno()` becomes readable.
+    """
+    def __init__(self, path, config, name="default", clock=monotonic):
+        self.clock = clock
+        self.name = name
+        self.key = 'phase'
+        self.listeners = []
+        self.events = []
+        self.ids = itertools.count(1)
+        self.buffer = LineBuffer()
+        self.last = None
+        self.phase = None
+        self.paused = False
+        self.running = False
+        self.deadline = None
+        self.left = 0
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(REQUEST_TIMEOUT)
+        try:
+            self.sock.connect(path)
+            self.request("attach", config=self.timeValues(config))
+        except Exception:
+            self.sock.close()
+            raise
+
+    @staticmethod
+    def timeValues(config):
+        return dict((key, config[key]) for key in CONFIG_KEYS if key in config)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def listen(self, listener):
+        self.listeners.append(listener)
+
+    def request(self, cmd, **args):
+        """Send a command and wait for its reply; raises ValueError with the
+        daemon's error, if any, else returns whether the command took effect.
+        """
+        msgId = next(self.ids)
+        args.update(cmd=cmd, id=msgId, name=self.name)
+        reply = None
+        try:
+            self.sock.sendall(encode(args))
+            while reply is None:
+                data = self.sock.recv(65536)
+                if not data:
+                    raise IOError("Timer daemon went away")
+                for msg in self.buffer.feed(data):
+                    if reply is None and msg.get("id") == msgId:
+                        reply, earlier = msg, len(self.events)
+                    else:
+                        self.events.append(msg)
+        except socket.timeout:
+            raise IOError("Timer daemon did not answer within %gs" % REQUEST_TIMEOUT)
+        # Events pushed before the reply happened before it, the others after.
+        self.events, later = self.events[:earlier], self.events[earlier:]
+        self.dispatch()
+        if "state" in reply:
+            self.apply(reply["state"])
+        self.events.extend(later)
+        self.dispatch()
+        if reply.get("error"):
+            raise ValueError(reply["error"])
+        return reply.get("ok")
+
+    def readEvents(self):
+        # The socket has a timeout for requests, so only read what is there;
+        # a request may well have read it already.
+        if select.select([self.sock], [], [], 0)[0]:
+            data = self.sock.recv(65536)
+            if not data:
+                raise IOError("Timer daemon went away")
+            self.events.extend(self.buffer.feed(data))
+        self.dispatch()
+
+    def dispatch(self):
+        events, self.events = self.events, []
+        for msg in events:
+            if "event" in msg:
+                self.apply(msg["state"])
+                for listener in list(self.listeners):
+                    listener(msg["event"], self)
+
+    def apply(self, state):
+        self.last = state
+        self.phase = Phase(state["phase"], state["minutes"] * 60, state["msg"],
+                           state["sound"], state["icon"], state["stand"])
+        self.paused = state["paused"]
+        self.running = state["running"]
+        self.left = state["remaining"]
+        self.deadline = self.clock() + self.left if self.running else None
+
+    def state(self):
+        return dict(self.last, remaining=self.remaining())
+
+    @property
+    def stand(self):
+        return self.phase.stand
+
+    @property
+    def msg(self):
+        return self.phase.msg
+
+    def minutes(self):
+        return self.phase.seconds / 60.0
+
+    def remaining(self):
+        if self.paused or self.deadline is None:
+            return self.left
+        return max(0.0, self.deadline - self.clock())
+
+    def setValues(self, config):
+        compileProgram(config)  # Raises ValueError for a bad program, as TimerEngine does.
+        self.request("config", config=self.timeValues(config))
+
+    def start(self, stand):
+        self.request("start", stand=stand)
+
+    def stop(self):
+        self.request("stop")
+
+    def pause(self):
+        return self.request("pause")
+
+    def resume(self):
+        return self.request("resume")
+
+    def close(self):
+        self.sock.close()
@@ -0,0 +1,172 @@
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOCK_MONOTONIC = 1
+
+
+class timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+
+def clockMonotonic():
+    """time.monotonic() for Python 2, read through clock_gettime(CLOCK_MONOTONIC).
+
+    Returns None if libc (or, with older glibc, librt) has no clock_gettime.
+    """
+    for name in ("c", "rt"):
+        path = ctypes.util.find_library(name)
+        if not path:
+            continue
+        try:
+            gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        spec = timespec()
+        if gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+            continue
+
+        def monotonic():
+            # A timespec per call, as the sound and hook threads read the clock too.
+            spec = timespec()
+            if gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+                raise OSError(ctypes.get_errno(), "clock_gettime")
+            return spec.tv_sec + spec.tv_nsec * 1e-9
+        return monotonic
+    return None
+
+
+# Python 2 has no monotonic clock in the standard library; the wall clock
+# is the last resort, as NTP steps and clock changes then move deadlines.
+monotonic = getattr(time, 'monotonic', None) or clockMonotonic()
+if monotonic is None:
+    logger.warning("No monotonic clock: deadlines follow the wall clock")
+    monotonic = time.time
+
+_UNARMED = object()
+
+
+class ManualClock(object):
+    """A clock that only moves when told to, for simulations and benchmarks."""
+    def __init__(self, now=0.0):
+        self.now = float(now)
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, sec):
+        self.now += sec
+
+    def set(self, now):
+        self.now = max(self.now, now)
+
+
+class Scheduler(object):
+    """Keeps absolute deadlines by key and runs the callbacks that are due.
+
+    Nothing here polls: the owner is told (through `arm`) the delay until the
+    soonest deadline, or None when there is nothing left, and is expected to
+    call `runDue` once that delay has elapsed.
+    """
+    def __init__(self, clock=monotonic, arm=None):
+        self.clock = clock
+        self.arm = arm
+        self.heap = []
+        self.entries = {}
+        self.counter = itertools.count()
+        self.armed = _UNARMED
+        self.started = clock()
+        self.wakeups = 0
+        self.fired = 0
+        self.late = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def schedule(self, key, deadline, callback):
+        """Run `callback` at the absolute `deadline`, replacing any previous one for `key`."""
+        self._remove(key)
+        entry = [deadline, next(self.counter), key, callback]
+        self.entries[key] = entry
+        heapq.heappush(self.heap, entry)
+        self._rearm()
+
+    def scheduleIn(self, key, delay, callback):
+        self.schedule(key, self.clock() + delay, callback)
+
+    def deadline(self, key):
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def cancel(self, *keys):
+        for key in keys:
+            self._remove(key)
+        self._rearm()
+
+    def clear(self):
+        self.heap = []
+        self.entries.clear()
+        self._rearm()
+
+    def nextDeadline(self):
+        heap = self.heap
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def runDue(self):
+        """Run every callback whose deadline has passed; returns the next deadline."""
+        self.wakeups += 1
+        self.armed = _UNARMED
+        try:
+            while True:
+                now = self.clock()
+                deadline = self.nextDeadline()
+                if deadline is None or deadline > now:
+                    break
+                entry = heapq.heappop(self.heap)
+                key, callback = entry[2], entry[3]
+                del self.entries[key]
+                self.late[key] = now - deadline
+                self.fired += 1
+                callback()
+        finally:
+            self._rearm()
+        return self.nextDeadline()
+
+    def runUntil(self, until):
+        """Jump a ManualClock from deadline to deadline up to `until`."""
+        while True:
+            deadline = self.nextDeadline()
+            if deadline is None or deadline > until:
+                break
+            self.clock.set(deadline)
+            self.runDue()
+        self.clock.set(until)
+
+    def wakeupsPerHour(self):
+        elapsed = self.clock() - self.started
+        return self.wakeups * 3600.0 / elapsed if elapsed > 0 else 0.0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            # Lazily deleted; skipped once it reaches the top of the heap.
+            entry[3] = None
+
+    def _rearm(self):
+        deadline = self.nextDeadline()
+        if deadline == self.armed:
+            return
+        self.armed = deadline
+        if self.arm is not None:
+            self.arm(None if deadline is None else max(0.0, deadline - self.clock()))
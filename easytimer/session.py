@@ -0,0 +1,237 @@
+import logging
+import os
+from threading import Thread
+
+from easytimer.config import DEFAULTS, ConfigStore
+from easytimer.engine import TIME_KEYS, TimerEngine
+from easytimer.history import HistoryLog
+from easytimer.hooks import makeHooks
+from easytimer.idle import AWAY_KEYS, makeAway
+from easytimer.metrics import makeMetrics, wallDrift, writeStats
+from easytimer.program import compileProgram
+from easytimer.sounds import makeSounds
+from easytimer.sync import makeSync
+
+logger = logging.getLogger(__name__)
+
+# The timer configured at the top level of the config; the others are in "timers".
+MAIN_TIMER = "default"
+
+
+class Session(object):
+    """What a running timer holds besides its front end: the config store,
+    history, sounds, hooks, sync, idle watching, statistics and the
+    control commands, for the tray and the headless timer alike.
+
+    A front end mixes this in and provides `timers` (name to engine, the
+    main one first), `engine` and `scheduler`, and these methods:
+    `watch(fd, handler)` to call `handler()` whenever `fd` is readable
+    until `unwatch(fd)`; `error(text)` to show a problem; `updateTimers()`
+    to reconfigure its timers, raising ValueError if the config is bad;
+    `onStart(engine)` and the like for each engine event; and
+    `requestSetup()` and `requestQuit()` for those control commands.
+    """
+    def loadConfig(self):
+        self.store = ConfigStore()
+        self.config = self.store.load()
+        fd = self.store.watch()
+        if fd is not None:
+            self.watch(fd, self.configChanged)
+        self.metrics = makeMetrics(self.config)
+        self.metrics.collect(wallDrift())
+
+    def makeEngine(self, config, factory=TimerEngine, **kwargs):
+        """`factory(config, **kwargs)`, an engine; if the config's timings are
+        bad, says so and uses the default ones.
+        """
+        try:
+            return factory(config, **kwargs)
+        except ValueError as exc:
+            self.error("%s; using the default timings until that is fixed." % exc)
+            defaults = dict((key, DEFAULTS[key]) for key in TIME_KEYS)
+            return factory(dict(config, program=None, **defaults), **kwargs)
+
+    def openSession(self, control):
+        """Everything around the main timer, once `engine` exists."""
+        self.history = None
+        if self.config.get('history'):
+            try:
+                self.history = HistoryLog()
+                self.engine.listen(self.history.record)
+            except (IOError, OSError):
+                logger.exception("Not recording history")
+        self.sounds = makeSounds(self.config, self.metrics)
+        self.hooks = self.makeHooks()
+        self.sync = makeSync(self.engine, self.syncConfig, self.config)
+        if self.sync is not None:
+            self.watch(self.sync.fileno(), self.sync.receive)
+            self.sync.schedule(self.scheduler)
+        self.control = control
+        if control is not None:
+            control.handler = self.handleCommand
+            control.watch = self.watch
+            control.unwatch = self.unwatch
+            self.watch(control.fileno(), control.accept)
+        self.away = None
+        self.awaySettings = None
+        self.awayPaused = []
+        self.scheduleStats()
+
+    def shutdown(self):
+        """Close what the session holds open, however it exits; safe to call again."""
+        if self.history is not None:
+            self.history.finish(self.engine)
+            self.history.close()
+            self.history = None
+        if self.control is not None:
+            self.control.close()
+        if self.away is not None:
+            self.away.close()
+            self.away = None
+        self.sounds.close()
+        self.hooks.close()
+        self.store.close()
+
+    def getText(self, key, default=None):
+        return self.config.get(key, DEFAULTS.get(key, default))
+
+    def timerConfig(self, name):
+        """The main timer runs on the configuration itself, the others on their overrides."""
+        if name == MAIN_TIMER:
+            return self.config
+        return dict(self.config, **(self.config.get('timers') or {}).get(name, {}))
+
+    def onEvent(self, event, engine):
+        getattr(self, 'on' + event.capitalize())(engine)
+        self.hooks.listener(event, engine)
+
+    def handleCommand(self, msg):
+        """Carry out a request from the command line client; returns the reply."""
+        cmd = msg.get("cmd")
+        reply = {"ok": True}
+        engine = self.timers.get(msg.get("timer") or MAIN_TIMER)
+        if engine is None:
+            reply.update(ok=False, error="Unknown timer: %s" % msg.get("timer"))
+            engine = self.engine
+        elif cmd == "start":
+            engine.start(bool(msg.get("stand")))
+        elif cmd == "stop":
+            engine.stop()
+        elif cmd == "pause":
+            if not engine.pause():
+                reply.update(ok=False, error=self.getText('error_pause'))
+        elif cmd == "resume":
+            if not engine.resume():
+                reply.update(ok=False, error=self.getText('error_resume'))
+        elif cmd == "setup":
+            error = self.requestSetup()
+            if error:
+                reply.update(ok=False, error=error)
+        elif cmd == "quit":
+            self.requestQuit()
+        elif cmd == "stats":
+            reply["stats"] = self.metrics.snapshot()
+        elif cmd != "status":
+            reply.update(ok=False, error="Unknown command: %s" % cmd)
+        reply["state"] = engine.state()
+        if len(self.timers) > 1:
+            reply["timers"] = dict((name, timer.state()) for name, timer in self.timers.items())
+        return reply
+
+    def configChanged(self):
+        if self.store.readChanges():
+            logger.info("Reloaded: %s", self.store.path)
+            self.applyConfig()
+
+    def setValues(self, **config):
+        self.store.update(**config)
+        if self.sync is not None:
+            self.sync.publishConfig(config)
+        self.applyConfig()
+
+    def syncConfig(self, values):
+        """Settings changed on another machine."""
+        self.store.update(**values)
+        self.applyConfig()
+
+    def applyConfig(self):
+        """Follow a changed config; returns False if it was rejected."""
+        try:
+            self.updateTimers()
+        except ValueError as exc:
+            self.error(str(exc))
+            return False
+        self.sounds = makeSounds(self.config, self.metrics, self.sounds)
+        self.loadSounds()
+        self.scheduleStats()
+        old, self.hooks = self.hooks, self.makeHooks()
+        old.close()
+        self.watchAway()
+        return True
+
+    def makeHooks(self):
+        try:
+            return makeHooks(self.config, self.metrics)
+        except ValueError as exc:
+            self.error(str(exc))
+            return makeHooks({})
+
+    def loadSounds(self):
+        """Decode the phase sounds in the background, ahead of their first use."""
+        fnames = set()
+        for name, engine in self.timers.items():
+            # Timers on the daemon only have their config here.
+            timeline = getattr(engine, 'timeline', None)
+            if timeline is None:
+                try:
+                    timeline = compileProgram(self.timerConfig(name))
+                except ValueError:
+                    continue
+            fnames.update(phase.sound for phase in timeline.phases)
+        thread = Thread(target=self.sounds.preload, args=(fnames,))
+        thread.daemon = True
+        thread.start()
+
+    def setAway(self, away):
+        """Pause the running timers while the user is away, and resume them on return."""
+        if away:
+            self.awayPaused = [name for name, engine in self.timers.items()
+                               if engine.running and not engine.paused]
+            for name in self.awayPaused:
+                self.timers[name].pause()
+            if self.awayPaused:
+                self.metrics.count("away_pauses")
+            return
+        names, self.awayPaused = self.awayPaused, []
+        for name in names:
+            engine = self.timers.get(name)
+            if engine is not None and engine.paused:
+                engine.resume()
+
+    def watchAway(self):
+        """Follow idle and lock events as "idle_pause" and "lock_pause" say."""
+        settings = tuple(self.config.get(key) for key in AWAY_KEYS)
+        if settings == self.awaySettings:
+            return
+        self.awaySettings = settings
+        if self.away is not None:
+            for source in self.away.sources:
+                self.unwatch(source.fileno())
+            self.away.close()
+            self.setAway(False)
+        self.away = makeAway(self.config, self.setAway)
+        for source in (self.away.sources if self.away is not None else ()):
+            fd = source.fileno()
+            self.watch(fd, lambda source=source, fd=fd: source.read() or self.unwatch(fd))
+
+    def scheduleStats(self):
+        """Write the metrics to "stats_file" every "stats_interval" seconds, if set."""
+        path = self.config.get('stats_file')
+        if not path:
+            self.scheduler.cancel('stats')
+            return
+        def write():
+            writeStats(self.metrics, os.path.expanduser(path))
+            self.scheduler.scheduleIn('stats', interval, write)
+        interval = max(1, self.config.get('stats_interval') or 60)
+        self.scheduler.scheduleIn('stats', interval, write)
@@ -0,0 +1,309 @@
+import collections
+import io
+import logging
+import os
+import subprocess
+from threading import Condition, Lock, Thread, Timer
+import wave
+
+from easytimer.metrics import NullMetrics
+from easytimer.scheduler import monotonic
+
+logger = logging.getLogger(__name__)
+
+Pcm = collections.namedtuple("Pcm", "rate channels width data")
+
+# ALSA sample formats, by sample width in bytes.
+FORMATS = {1: "U8", 2: "S16_LE", 3: "S24_3LE", 4: "S32_LE"}
+
+CACHE_BYTES = 16 * 1024 * 1024
+
+# What to do with a cue when others are waiting: drop it if the same sound
+# is already queued, throw away everything older, or drop it if full.
+POLICIES = ("coalesce", "latest", "drop")
+
+# The settings a Sounds is built from; the phase sounds themselves are not
+# among them, as they only need preloading.
+SOUND_KEYS = ("play_cmd", "audio_sink", "audio_file", "audio_decoder",
+              "sound_queue", "sound_policy", "sound_timeout", "sound_stale")
+
+
+def readWave(fd):
+    wav = wave.open(fd)
+    try:
+        return Pcm(wav.getframerate(), wav.getnchannels(), wav.getsampwidth(),
+                   wav.readframes(wav.getnframes()))
+    finally:
+        wav.close()
+
+
+def decode(fname, decoder=None):
+    """Decode a sound file to PCM; WAV natively, anything else through `decoder`."""
+    try:
+        with open(fname, 'rb') as fd:
+            return readWave(fd)
+    except (wave.Error, EOFError):
+        pass
+    if not decoder:
+        return None
+    cmd = [arg.format(file=fname) for arg in decoder]
+    with open(os.devnull, 'wb') as wr:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=wr)
+        data = proc.communicate()[0]
+    if proc.returncode:
+        raise IOError("%s exited with %d" % (cmd[0], proc.returncode))
+    return readWave(io.BytesIO(data))
+
+
+class PcmCache(object):
+    """Decoded sounds, least recently used first, bounded by total size."""
+    def __init__(self, maxBytes=CACHE_BYTES, decoder=None):
+        self.maxBytes = maxBytes
+        self.decoder = decoder
+        self.size = 0
+        self.items = collections.OrderedDict()
+        self.lock = Lock()
+
+    def get(self, fname):
+        """The PCM for `fname`, decoding it on a miss; None if it can't be decoded."""
+        try:
+            stat = os.stat(fname)
+        except OSError:
+            return None
+        key = (fname, stat.st_mtime, stat.st_size)
+        with self.lock:
+            pcm = self.items.pop(key, None)
+            if pcm is not None:
+                self.items[key] = pcm
+                return pcm
+        try:
+            pcm = decode(fname, self.decoder)
+        except Exception:
+            logger.exception("Cannot decode: %s", fname)
+            return None
+        if pcm is None or len(pcm.data) > self.maxBytes:
+            return None
+        with self.lock:
+            self.items[key] = pcm
+            self.size += len(pcm.data)
+            while self.size > self.maxBytes:
+                _, old = self.items.popitem(last=False)
+                self.size -= len(old.data)
+        return pcm
+
+
+class PipeSink(object):
+    """A long-lived player process that PCM is streamed into through stdin.
+
+    The process is only restarted when it dies or the sample format changes.
+    """
+    def __init__(self, cmd):
+        self.cmd = tuple(cmd)
+        self.proc = None
+        self.format = None
+
+    def write(self, pcm):
+        fmt = (pcm.rate, pcm.channels, pcm.width)
+        if self.proc is None or self.proc.poll() is not None or fmt != self.format:
+            self.close()
+            cmd = [arg.format(rate=pcm.rate, channels=pcm.channels,
+                              format=FORMATS[pcm.width]) for arg in self.cmd]
+            with open(os.devnull, 'wb') as wr:
+                self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                             stdout=wr, stderr=wr)
+            self.format = fmt
+        self.proc.stdin.write(pcm.data)
+        self.proc.stdin.flush()
+
+    def kill(self):
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+                self.proc.wait()
+            except (IOError, OSError):
+                pass
+            self.proc = None
+
+
+class FileSink(object):
+    """Appends raw PCM to a file; mostly useful for testing."""
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, pcm):
+        with open(self.path, 'ab') as fd:
+            fd.write(pcm.data)
+
+    def kill(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def makeSink(config):
+    if config.get('audio_file'):
+        return FileSink(os.path.expanduser(config['audio_file']))
+    if config.get('audio_sink'):
+        return PipeSink(config['audio_sink'])
+    return None
+
+
+class Sounds(object):
+    """Provides a multi-platform way to play sounds through the native OS.
+
+    Sounds that can be decoded are cached as PCM and streamed to `sink`;
+    anything else (or everything, without a sink) is handed to `cmd`.
+
+    Cues are played one at a time by a single worker thread from a queue of
+    at most `maxQueue` entries, managed according to `policy` (see POLICIES).
+    Cues older than `stale` seconds are skipped, and a player still running
+    after `timeout` seconds is killed.  How long cues wait and play is
+    observed by `metrics`.
+    """
+    def __init__(self, cmd, sink=None, cache=None, maxQueue=4, policy="coalesce",
+                 timeout=30.0, stale=10.0, metrics=None):
+        if policy not in POLICIES:
+            raise ValueError("Unknown sound policy: %r" % policy)
+        self.cmd = tuple(cmd)
+        self.sink = sink
+        self.cache = cache if cache is not None else PcmCache()
+        self.maxQueue = maxQueue
+        self.policy = policy
+        self.timeout = timeout
+        self.stale = stale
+        self.queue = collections.deque()
+        self.cond = Condition()
+        self.worker = None
+        self.current = None
+        self.aborted = False
+        self.dropped = 0
+        self.metrics = metrics if metrics is not None else NullMetrics()
+
+    def preload(self, fnames):
+        if self.sink is not None:
+            for fname in fnames:
+                if fname:
+                    self.cache.get(fname)
+
+    def playSound(self, fname):
+        with self.cond:
+            queue = self.queue
+            if self.policy == "latest":
+                self.dropped += len(queue)
+                queue.clear()
+            elif self.policy == "coalesce" and any(name == fname for name, _ in queue):
+                self.dropped += 1
+                return
+            if len(queue) >= self.maxQueue:
+                self.dropped += 1
+                if self.policy == "drop":
+                    return
+                queue.popleft()
+            queue.append((fname, monotonic()))
+            if self.worker is None:
+                self.worker = Thread(target=self.run, name="Sounds")
+                self.worker.daemon = True
+                self.worker.start()
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                fname, queued = self.queue.popleft()
+            if fname is None:
+                if self.sink is not None:
+                    self.sink.close()
+                return
+            if self.stale and monotonic() - queued > self.stale:
+                logger.info("Skipped stale: %s", fname)
+                continue
+            self.aborted = False
+            killer = Timer(self.timeout, self.abort)
+            killer.daemon = True
+            killer.start()
+            started = monotonic()
+            self.metrics.observe("sound_wait_seconds", started - queued)
+            try:
+                self.play(fname)
+                logger.info("Played: %s", fname)
+            except:
+                logger.exception("Error playing: %s", fname)
+            finally:
+                killer.cancel()
+                self.current = None
+                self.metrics.observe("sound_play_seconds", monotonic() - started)
+
+    def abort(self):
+        """Kill whatever is playing right now."""
+        current = self.current
+        if current is not None:
+            logger.warning("Sound timed out after %ss", self.timeout)
+            self.aborted = True
+            try:
+                current.kill()
+            except OSError:
+                pass
+
+    def play(self, fname):
+        pcm = self.cache.get(fname) if self.sink is not None else None
+        if pcm is not None:
+            self.current = self.sink
+            try:
+                self.sink.write(pcm)
+                return
+            except (IOError, OSError):
+                self.sink.close()
+                if self.aborted:
+                    return
+                logger.exception("Audio sink failed, falling back to: %s", self.cmd[0])
+        cmd = self.cmd + (fname,)
+        logger.info("Running: '%s' ...", fname)
+        with open(os.devnull) as rd:
+            with open(os.devnull, 'wb') as wr:
+                self.current = subprocess.Popen(cmd, stdin=rd, stdout=wr, stderr=wr)
+                self.current.wait()
+
+    def close(self):
+        """Drop the queue and let the worker close the sink once it has finished
+        what is playing, so the caller never waits for the player to exit.
+        """
+        with self.cond:
+            self.queue.clear()
+            if self.worker is not None:
+                self.queue.append((None, 0))
+                self.cond.notify()
+                return
+        if self.sink is not None:
+            self.sink.close()
+
+
+def makeSounds(config, metrics=None, current=None):
+    """Sounds for `config`: `current` itself if its settings did not change,
+    otherwise a new one, and `current` is closed.
+    """
+    settings = [config.get(key) for key in SOUND_KEYS]
+    if current is not None:
+        if current.settings == settings:
+            return current
+        current.close()
+    policy = config.get('sound_policy')
+    if policy not in POLICIES:
+        logger.warning("Unknown sound policy: %r", policy)
+        policy = POLICIES[0]
+    sounds = Sounds(config.get('play_cmd'), makeSink(config),
+                    PcmCache(decoder=config.get('audio_decoder')),
+                    maxQueue=config.get('sound_queue'),
+                    policy=policy,
+                    timeout=config.get('sound_timeout'),
+                    stale=config.get('sound_stale'),
+                    metrics=metrics)
+    sounds.settings = settings
+    return sounds
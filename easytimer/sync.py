@@ -0,0 +1,266 @@
+"""Keeps the timers of one user on several machines in step, over UDP.
+
+Each instance holds a small versioned state: the timer ("timer") and the
+synced settings ("config:<key>"), each entry tagged with a Lamport version
+and the node and sequence number of the write.  The newest version of an
+entry wins, ties going to the higher node id, so every instance ends up
+with the same state whatever order messages arrive in.
+
+Changes are pushed to every known peer as a "delta" with just the changed
+entries.  Every `interval` seconds a "hello" carries what the sender has
+seen of each node's writes; a peer that knows more replies with a "state"
+holding only the entries the sender is missing, which is how instances
+catch up after a partition or a lost datagram.  Datagrams are signed with
+a shared secret, and peers are found by broadcast or listed explicitly.
+"""
+import binascii
+import errno
+import hashlib
+import hmac
+import json
+import logging
+import os
+import socket
+import time
+
+from easytimer.engine import TIME_KEYS
+
+logger = logging.getLogger(__name__)
+
+SYNC_PORT = 47123
+SYNC_INTERVAL = 30.0
+
+# The settings that follow the user from machine to machine; sound files
+# are left out as their paths are rarely the same everywhere.
+SYNC_KEYS = TIME_KEYS + ("program", "programs")
+
+DIGEST = hashlib.sha256
+MAX_DATAGRAM = 65507
+
+
+def parsePeer(peer, port=SYNC_PORT):
+    """("host", port) for "host" or "host:port"."""
+    host, _, num = peer.rpartition(":") if ":" in peer else (peer, "", "")
+    return (host, int(num) if num else port)
+
+
+class SyncPeer(object):
+    """One instance's end of the sync protocol.
+
+    `engine` is followed through its events and driven through `jump`;
+    `onConfig(values)` is called with synced settings changed elsewhere.
+    The owner calls `receive` whenever `fileno()` becomes readable and
+    `tick` every `interval` seconds (see `schedule`).
+    """
+    def __init__(self, engine, onConfig, secret, host="", port=SYNC_PORT, peers=(),
+                 discover=True, interval=SYNC_INTERVAL, wall=time.time):
+        if not secret:
+            raise ValueError("Syncing needs a shared \"sync_secret\"")
+        self.engine = engine
+        self.onConfig = onConfig
+        self.secret = secret.encode("utf-8")
+        self.port = port
+        self.discover = discover
+        self.interval = interval
+        self.wall = wall
+        self.node = binascii.hexlify(os.urandom(6)).decode("ascii")
+        self.lamport = 0
+        self.seq = 0
+        self.entries = {}
+        self.known = {}
+        self.peers = set(parsePeer(peer, port) for peer in peers)
+        self.applying = False
+        self.ending = False
+        self.sent = self.received = self.rejected = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if discover:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.sock.bind((host, port))
+        self.sock.setblocking(False)
+        self.address = self.sock.getsockname()
+        engine.listen(self.onEvent)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    def schedule(self, scheduler, key='sync'):
+        """Say hello now and every `interval` seconds on `scheduler`."""
+        def tick():
+            self.tick()
+            scheduler.scheduleIn(key, self.interval, tick)
+        tick()
+
+    # Local changes.
+
+    def timerState(self):
+        engine = self.engine
+        if not engine.running:
+            return {"running": False}
+        left = engine.remaining()
+        return {"running": True, "number": engine.number, "paused": engine.paused,
+                "left": left, "deadline": self.wall() + left}
+
+    def onEvent(self, event, engine):
+        if self.applying:
+            return
+        # Every instance moves on to the next phase by itself, at the same deadline.
+        if event == "end":
+            self.ending = True
+            return
+        if self.ending and event in ("start", "stop"):
+            self.ending = False
+            return
+        self.ending = False
+        self.write({"timer": self.timerState()})
+
+    def publishConfig(self, config):
+        """Share the synced settings in `config` that differ from what peers have."""
+        changed = {}
+        for key in SYNC_KEYS:
+            entry = self.entries.get("config:" + key)
+            if key in config and (entry is None or entry[3] != config[key]):
+                changed["config:" + key] = config[key]
+        if changed:
+            self.write(changed)
+
+    def write(self, values):
+        delta = {}
+        self.lamport += 1
+        for key, value in values.items():
+            self.seq += 1
+            delta[key] = self.entries[key] = [self.lamport, self.node, self.seq, value]
+        self.known[self.node] = self.seq
+        self.broadcast({"t": "delta", "entries": delta})
+
+    # Remote changes.
+
+    def merge(self, entries):
+        """Keep the newer of ours and theirs for each entry; returns the changed keys."""
+        changed = []
+        for key, entry in sorted(entries.items(), key=lambda item: item[1][2]):
+            version, node, seq, _ = entry
+            self.lamport = max(self.lamport, version)
+            # Only writes seen without a gap count as known, so a lost
+            # datagram is asked for again at the next hello.
+            if seq == self.known.get(node, 0) + 1:
+                self.known[node] = seq
+            current = self.entries.get(key)
+            if current is None or (version, node) > (current[0], current[1]):
+                self.entries[key] = entry
+                changed.append(key)
+        return changed
+
+    def apply(self, changed):
+        self.applying = True
+        try:
+            if "timer" in changed:
+                self.applyTimer(self.entries["timer"][3])
+            config = dict((key[len("config:"):], self.entries[key][3])
+                          for key in changed if key.startswith("config:"))
+            if config:
+                self.onConfig(config)
+        finally:
+            self.applying = False
+
+    def applyTimer(self, state):
+        engine = self.engine
+        if not state["running"]:
+            if engine.running:
+                engine.stop()
+            return
+        left = state["left"] if state["paused"] else state["deadline"] - self.wall()
+        engine.jump(state["number"], left, state["paused"])
+
+    # The wire.
+
+    def receive(self):
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+            except socket.error as exc:
+                if exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                if exc.args[0] == errno.ECONNREFUSED:
+                    # An earlier datagram reached a machine no longer syncing.
+                    continue
+                raise
+            msg = self.decode(data)
+            if msg is None or msg.get("from") == self.node:
+                continue
+            self.received += 1
+            self.peers.add(addr[:2])
+            self.handle(msg, addr[:2])
+
+    def handle(self, msg, addr):
+        kind = msg.get("t")
+        if kind in ("delta", "state"):
+            self.apply(self.merge(msg.get("entries", {})))
+        if kind == "state":
+            # They sent everything we were missing of what they know.
+            for node, seq in msg.get("known", {}).items():
+                self.known[node] = max(self.known.get(node, 0), seq)
+        elif kind == "hello":
+            theirs = msg.get("known", {})
+            missing = dict((key, entry) for key, entry in self.entries.items()
+                           if entry[2] > theirs.get(entry[1], 0))
+            if missing:
+                self.send({"t": "state", "entries": missing, "known": self.known}, addr)
+            if any(seq > self.known.get(node, 0) for node, seq in theirs.items()):
+                self.send({"t": "hello", "known": self.known}, addr)
+
+    def tick(self):
+        msg = {"t": "hello", "known": self.known}
+        for peer in list(self.peers):
+            self.send(msg, peer)
+        if self.discover:
+            self.send(msg, ("<broadcast>", self.port))
+
+    def broadcast(self, msg):
+        for peer in list(self.peers):
+            self.send(msg, peer)
+
+    def send(self, msg, addr):
+        msg = dict(msg, **{"from": self.node})
+        body = json.dumps(msg, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        try:
+            self.sock.sendto(self.sign(body) + body, addr)
+            self.sent += 1
+        except socket.error as exc:
+            logger.info("Cannot sync with %s:%s: %s", addr[0], addr[1], exc)
+
+    def sign(self, body):
+        return hmac.new(self.secret, body, DIGEST).hexdigest().encode("ascii")
+
+    def decode(self, data):
+        size = DIGEST().digest_size * 2
+        signature, body = data[:size], data[size:]
+        if not hmac.compare_digest(signature, self.sign(body)):
+            self.rejected += 1
+            return None
+        try:
+            return json.loads(body.decode("utf-8"))
+        except ValueError:
+            self.rejected += 1
+            return None
+
+
+def makeSync(engine, onConfig, config):
+    """A SyncPeer set up from the "sync_*" settings, or None if syncing is off."""
+    if not config.get('sync'):
+        return None
+    if not hasattr(engine, 'jump'):
+        logger.warning("Not syncing: the timer daemon keeps the countdown")
+        return None
+    try:
+        host, port = parsePeer(config.get('sync_bind') or ":%d" % SYNC_PORT)
+        return SyncPeer(engine, onConfig, config.get('sync_secret'), host, port,
+                        peers=config.get('sync_peers') or (),
+                        discover=config.get('sync_discover'),
+                        interval=config.get('sync_interval') or SYNC_INTERVAL)
+    except (ValueError, socket.error) as exc:
+        logger.warning("Not syncing: %s", exc)
+        return None
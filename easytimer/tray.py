@@ -0,0 +1,543 @@
+import collections
+from functools import partial
+import logging
+import math
+import os
+from PyQt4 import QtGui, QtCore
+import signal
+import socket
+import sys
+import time
+
+from easytimer.config import DEFAULTS
+from easytimer.control import ControlServer
+from easytimer.icons import IconSet, RingIcons
+from easytimer.notify import NOTIFY_MODES, CommandNotifier
+from easytimer.popups import PopupPool, TrayNotifier
+from easytimer.presenter import Presenter
+from easytimer.remote import RemoteEngine
+from easytimer.scheduler import Scheduler, monotonic
+from easytimer.session import MAIN_TIMER, Session
+
+logger = logging.getLogger('__name__')
+
+try:
+    # Built from res.qrc by "make" or "scons".  Imported only for its side
+    # effect of registering the icons under ":/res"; nothing here uses it.
+    from easytimer import res_rc  # noqa: F401
+    RES_DIR = ":/res"
+except ImportError:
+    RES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "res")
+
+ICONS = tuple(os.path.join(RES_DIR, name) for name in (
+    "sit1.png",
+    "sit2.png",
+    "stand1.png",
+    "stand2.png",
+    "paused.png",
+    "clock.png",
+))
+
+POLL_FAST = 0.250
+POLL_SLOW = 6.000
+ICON_TOGGLES = int(2 * POLL_SLOW / POLL_FAST + 0.5)
+
+class SetupUI(QtGui.QDialog):
+    def __init__(self, parent, sounds):
+        QtGui.QDialog.__init__(self, None)
+        # The generated form is only needed once the dialog is first opened.
+        from ui.timerUI import Ui_Timer
+        self.ui = Ui_Timer()
+        self.ui.setupUi(self)
+        self.parent = parent
+        self.sounds = sounds
+        self.connect(self.ui.buttonBox, QtCore.SIGNAL("accepted()"), self.setTimerValues)
+        self.connect(self.ui.StandingFileBtn, QtCore.SIGNAL("clicked()"), self.standingFile)
+        self.connect(self.ui.StandingPlayBtn, QtCore.SIGNAL("clicked()"), self.playStanding)
+        self.connect(self.ui.SittingFileBtn, QtCore.SIGNAL("clicked()"), self.sittingFile)
+        self.connect(self.ui.SittingPlayBtn, QtCore.SIGNAL("clicked()"), self.playSitting)
+
+    def soundFile(self, key, ui):
+        current = str(ui.text())
+        caption = self.config.get(key, DEFAULTS[key])
+        filters = ";;".join((self.config.get('files_audio', DEFAULTS['files_audio']),
+                             self.config.get('files_all', DEFAULTS['files_all'])))
+        value = QtGui.QFileDialog.getOpenFileName(parent=self, caption=caption, filter=filters,
+                                                  directory=os.path.dirname(current))
+        if value:
+            ui.setText(value)
+        
+    def standingFile(self):
+        self.soundFile('sound_standing', self.ui.StandingFile)
+
+    def sittingFile(self):
+        self.soundFile('sound_sitting', self.ui.SittingFile)
+
+    def playSitting(self):
+        fname = str(self.ui.SittingFile.text())
+        self.sounds.playSound(fname)
+
+    def playStanding(self):
+        fname = str(self.ui.StandingFile.text())
+        self.sounds.playSound(fname)
+
+    def setValues(self, config):
+        self.config = config
+        self.ui.FirstTime.setValue(config["sitting_min"])
+        self.ui.FirstText.setText(config["sitting_msg"])
+        self.ui.SittingFile.setText(config["sitting_sound"])
+        self.ui.SecondTime.setValue(config["standing_min"])
+        self.ui.SecondText.setText(config["standing_msg"])
+        self.ui.StandingFile.setText(config["standing_sound"])
+
+    def setTimerValues(self):
+        self.parent.setValues(
+            sitting_min=self.ui.FirstTime.value(),
+            sitting_msg=str(self.ui.FirstText.text()),
+            sitting_sound=str(self.ui.SittingFile.text()),
+            standing_min=self.ui.SecondTime.value(),
+            standing_msg=str(self.ui.SecondText.text()),
+            standing_sound=str(self.ui.StandingFile.text())
+        )
+        self.hide()
+
+
+class SystemTrayIcon(QtGui.QSystemTrayIcon, Session):
+
+    def __init__(self, icon, parent=None, control=None, clock=monotonic):
+        QtGui.QSystemTrayIcon.__init__(self, icon, parent)
+        self.parent = parent
+        self.engine = None
+        self.timers = collections.OrderedDict()
+        self.daemons = {}
+        self.notifiers = {}
+        self.loadConfig()
+        self.setRemaining = self.metrics.timed("set_remaining_seconds", self.setRemaining)
+        self.popups = PopupPool(self.config.get('popup_pool'))
+        self.notifier = self.makeNotifier()
+
+        self.setupDialog = None
+        self.phaseError = 0.0
+        self.shown = None
+        self.presenter = Presenter(self.getText, self.setToolTip, self.setIcon,
+                                   defer=self.deferFlush,
+                                   quantum=self.config.get('tip_quantum'))
+        self.presenter.tooltip(0, None, False)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.scheduler = Scheduler(clock, arm=self.armTimer)
+        self.connect(self.timer, QtCore.SIGNAL("timeout()"), self.runDue)
+        self.engine = self.addTimer(MAIN_TIMER)
+        self.openSession(control)
+        self.metrics.collect(self.collectStats)
+
+        self.allIcons = IconSet(ICONS)
+        self.customIcons = {}
+        self.ring = None
+        self.ringSettings = None
+        self.ring = self.makeRing()
+        self.updateTimers()
+        self.loadSounds()
+        self.watchAway()
+
+    def watch(self, fd, handler):
+        """Call `handler()` whenever `fd` is readable, until `unwatch(fd)`."""
+        notifier = QtCore.QSocketNotifier(fd, QtCore.QSocketNotifier.Read, self)
+        self.connect(notifier, QtCore.SIGNAL("activated(int)"), lambda _: handler())
+        self.notifiers[fd] = notifier
+
+    def unwatch(self, fd):
+        notifier = self.notifiers.pop(fd, None)
+        if notifier is not None:
+            notifier.setEnabled(False)
+            notifier.deleteLater()
+
+    def addTimer(self, name):
+        config = self.timerConfig(name)
+        engine = self.attachDaemon(name, config) if self.config.get('daemon_socket') else None
+        if engine is None:
+            key = 'phase' if name == MAIN_TIMER else ('phase', name)
+            engine = self.makeEngine(config, scheduler=self.scheduler, key=key)
+            engine.end = self.metrics.timed("phase_end_seconds", engine.end)
+        engine.name = name
+        engine.listen(self.onEvent)
+        self.timers[name] = engine
+        if name != MAIN_TIMER and config.get('autostart'):
+            engine.start(False)
+        return engine
+
+    def attachDaemon(self, name, config):
+        """A RemoteEngine for timer `name`, or None (after saying why) if the daemon is not there."""
+        path = self.config['daemon_socket']
+        try:
+            engine = self.makeEngine(config, partial(RemoteEngine, path), name=name)
+        except (socket.error, IOError) as exc:
+            self.error("Cannot reach the timer daemon at %s (%s); timing here instead." % (path, exc))
+            return None
+        notifier = QtCore.QSocketNotifier(engine.fileno(), QtCore.QSocketNotifier.Read, self)
+        self.connect(notifier, QtCore.SIGNAL("activated(int)"), lambda _: self.readDaemon(engine))
+        self.daemons[name] = notifier
+        return engine
+
+    def removeTimer(self, name):
+        engine = self.timers.pop(name)
+        engine.listeners = []
+        engine.stop()
+        self.scheduler.cancel(('tip', name))
+        notifier = self.daemons.pop(name, None)
+        if notifier is not None:
+            notifier.setEnabled(False)
+            engine.close()
+        self.refreshIcon(engine)
+
+    def updateTimers(self):
+        """Add, remove and reconfigure the timers to match the "timers" config."""
+        names = [MAIN_TIMER] + sorted(self.config.get('timers') or {})
+        changed = names != list(self.timers)
+        for name in list(self.timers):
+            if name not in names:
+                self.removeTimer(name)
+        for name in names:
+            if name not in self.timers:
+                self.addTimer(name)
+            else:
+                self.timers[name].setValues(self.timerConfig(name))
+        # Keep the main timer first, and the others in order.
+        for name in names:
+            self.timers[name] = self.timers.pop(name)
+        if changed or self.contextMenu() is None:
+            self.buildMenu()
+
+    def buildMenu(self):
+        """The main timer's commands, then a submenu for each of the other timers."""
+        def addMenu(menu, key, method, *args):
+            self.connect(menu.addAction(self.getText(key)),
+                         QtCore.SIGNAL("triggered()"), lambda: method(*args))
+
+        old = self.contextMenu()
+        menu = QtGui.QMenu(self.parent)
+        addMenu(menu, "text_sit", self.startSitting)
+        addMenu(menu, "text_stand", self.startStanding)
+        menu.addSeparator()
+        addMenu(menu, "text_pause", self.pauseTimer)
+        addMenu(menu, "text_resume", self.resumeTimer)
+        menu.addSeparator()
+        addMenu(menu, "text_cancel", self.stopTimer)
+        menu.addSeparator()
+        for name in list(self.timers)[1:]:
+            sub = menu.addMenu(name)
+            addMenu(sub, "text_start", self.startTimer, name)
+            addMenu(sub, "text_pause", self.pauseTimer, name)
+            addMenu(sub, "text_resume", self.resumeTimer, name)
+            addMenu(sub, "text_cancel", self.stopTimer, name)
+        if len(self.timers) > 1:
+            menu.addSeparator()
+        addMenu(menu, "text_setup", self.setup)
+        addMenu(menu, "text_exit", self.exit)
+        self.setContextMenu(menu)
+        if old is not None:
+            old.deleteLater()
+
+    def exit(self):
+        self.shutdown()
+        sys.exit(0)
+
+    def requestSetup(self):
+        QtCore.QTimer.singleShot(0, self.setup)
+
+    def requestQuit(self):
+        QtCore.QTimer.singleShot(0, self.exit)
+
+    def error(self, msg):
+        self.popUp('title_error', msg, 15)
+
+    def startSitting(self):
+        self.engine.start(stand=False)
+
+    def startStanding(self):
+        self.engine.start(stand=True)
+
+    def startTimer(self, name=MAIN_TIMER):
+        self.timers[name].start(False)
+
+    def stopTimer(self, name=MAIN_TIMER):
+        self.timers[name].stop()
+
+    def pauseTimer(self, name=MAIN_TIMER):
+        if not self.timers[name].pause():
+            self.popUp('title_error', 'error_pause', 3)
+
+    def resumeTimer(self, name=MAIN_TIMER):
+        if not self.timers[name].resume():
+            self.popUp('title_error', 'error_resume', 3)
+
+    def readDaemon(self, engine):
+        try:
+            engine.readEvents()
+        except (IOError, OSError) as exc:
+            self.daemons[engine.name].setEnabled(False)
+            self.popUp('title_error', str(exc), 15)
+
+    def onStart(self, engine):
+        sound = engine.phase.sound
+        if sound:
+            self.sounds.playSound(sound)
+        self.refreshTip(engine)
+
+        # Flash the icon
+        self.shown = engine
+        self.icons = self.phaseIcons(engine.phase)
+        self.presenter.icon(self.icons[0])
+        if self.ring:
+            self.ring.prerender(self.icons[1], engine.phase.icon)
+        self.toggles = ICON_TOGGLES
+        self.scheduler.scheduleIn('icon', POLL_FAST, self.toggleIcon)
+
+        msg = self.getText("text_should")
+        msg = msg.format(act=engine.msg, mins=float(engine.minutes()))
+        title = self.getText("title_normal")
+        if engine is not self.engine:
+            title = "%s: %s" % (title, engine.name)
+        self.popUp(title, msg, self.config.get('notify_timeout'))
+
+    def onEnd(self, engine):
+        self.phaseError = self.scheduler.late.get(engine.key, 0.0)
+        self.metrics.observe("phase_late_seconds", self.phaseError)
+        logger.debug("Phase ended %.3fs late, %.1f wakeups/hour",
+                     self.phaseError, self.scheduler.wakeupsPerHour())
+
+    def onStop(self, engine):
+        self.scheduler.cancel(('tip', engine.name))
+        self.refreshIcon(engine)
+        self.setRemaining()
+
+    def onPause(self, engine):
+        self.scheduler.cancel(('tip', engine.name))
+        self.refreshIcon(engine)
+        self.setRemaining()
+        # Nobody is there to see it when the timer paused for their absence.
+        if engine.name not in self.awayPaused:
+            self.popUp('title_normal', 'text_pause')
+
+    def onResume(self, engine):
+        if engine.running:
+            self.shown = engine
+            self.refreshIcon(engine)
+        self.refreshTip(engine)
+
+    def setRemaining(self):
+        """Show the main timer's time left, followed by that of the other running timers."""
+        engine = self.engine
+        others = [(name, timer.remaining(), timer.msg, timer.paused)
+                  for name, timer in self.timers.items()
+                  if timer is not engine and timer.running]
+        self.presenter.tooltip(engine.remaining(), engine.msg, engine.paused, others)
+
+    def deferFlush(self):
+        QtCore.QTimer.singleShot(0, self.presenter.flush)
+
+    def refreshTip(self, engine=None):
+        """Update the tooltip, and wake up again only when its text would change."""
+        engine = engine or self.engine
+        self.setRemaining()
+        left = engine.remaining()
+        if engine.paused or not engine.running or left <= 0:
+            return
+        step = self.presenter.quantum * 60
+        steps = math.ceil(left / step - 1e-9) - 1
+        if steps > 0:
+            self.scheduler.schedule(('tip', engine.name), engine.deadline - steps * step,
+                                    lambda: self.refreshTip(engine))
+
+    def focus(self):
+        """The timer the icon follows: the last one started, else the first one counting down."""
+        for engine in [self.shown] + list(self.timers.values()):
+            if engine is not None and engine.running and not engine.paused:
+                return engine
+        return None
+
+    def refreshIcon(self, engine):
+        """After `engine` changed, show what the icon should now follow.
+
+        The icon is left alone while it flashes for the start of another timer
+        that is still counting down.
+        """
+        shown = self.shown
+        if (shown in (engine, None) or shown not in self.timers.values()
+                or not shown.running or shown.paused):
+            self.scheduler.cancel('icon')
+            self.showRing()
+
+    def toggleIcon(self):
+        self.toggles -= 1
+        if self.toggles > 1:
+            self.presenter.icon(self.icons[self.toggles % 2])
+            self.scheduler.scheduleIn('icon', POLL_FAST, self.toggleIcon)
+        else:
+            self.showRing()
+
+    def phaseIcons(self, phase):
+        """The flashing pair of icons for a phase: built-in "sit"/"stand" or an image file."""
+        if phase.icon in ("sit", "stand"):
+            ind = 2 if phase.icon == "stand" else 0
+            return [self.allIcons[ind], self.allIcons[ind + 1]]
+        icon = self.customIcons.get(phase.icon)
+        if icon is None:
+            icon = self.customIcons[phase.icon] = QtGui.QIcon(os.path.expanduser(phase.icon))
+        return [icon, icon]
+
+    def showRing(self):
+        """Show the steady phase icon, with a ring for the time left if enabled."""
+        engine = self.focus()
+        if engine is None:
+            self.scheduler.cancel('ring')
+            paused = any(timer.running for timer in self.timers.values())
+            self.presenter.icon(self.allIcons[-2 if paused else -1])
+            return
+        icon = self.phaseIcons(engine.phase)[1]
+        if not self.ring:
+            self.presenter.icon(icon)
+            return
+        length = engine.minutes() * 60
+        fraction = engine.remaining() / length
+        name = engine.phase.icon
+        self.presenter.icon(self.ring.frame(icon, name, fraction))
+        when = self.ring.nextChange(engine.deadline, length, fraction)
+        if when is not None:
+            self.scheduler.schedule('ring', when, self.showRing)
+        else:
+            self.scheduler.cancel('ring')
+
+    def armTimer(self, delay):
+        if delay is None:
+            self.timer.stop()
+        else:
+            self.timer.start(int(math.ceil(delay * 1000)))
+
+    def runDue(self):
+        try:
+            self.scheduler.runDue()
+        except Exception as exc:
+            self.popUp('title_error', str(exc), 15)
+
+    def collectStats(self):
+        """The figures the tray keeps anyway, for the metrics snapshots."""
+        scheduler = self.scheduler
+        return {
+            "wakeups": scheduler.wakeups,
+            "wakeups_per_hour": scheduler.wakeupsPerHour(),
+            "deadlines_fired": scheduler.fired,
+            "deadlines_pending": len(scheduler),
+            "tray_pushes": self.presenter.pushes,
+            "tray_pushes_skipped": self.presenter.skipped,
+            "sounds_dropped": self.sounds.dropped,
+            "hooks_running": self.hooks.running(),
+            "popups_live": self.popups.live(),
+            "notifications_live": self.notifier.live() if self.notifier is not self.popups else 0,
+            "popups_created": self.popups.created,
+        }
+
+    def setup(self):
+        if self.setupDialog is None:
+            self.setupDialog = SetupUI(self, self.sounds)
+        self.setupDialog.setValues(self.config)
+        self.setupDialog.show()
+        self.setupDialog.raise_()
+
+    def applyConfig(self):
+        if not Session.applyConfig(self):
+            return
+        self.presenter.quantum = self.config.get('tip_quantum')
+        self.presenter.reset()
+        for engine in self.timers.values():
+            self.refreshTip(engine)
+        ring = self.makeRing()
+        if ring is not self.ring:
+            self.ring = ring
+            # A flashing icon moves on to the new ring by itself.
+            if 'icon' not in self.scheduler:
+                self.showRing()
+        if self.setupDialog is not None:
+            self.setupDialog.sounds = self.sounds
+        self.popups.resize(self.config.get('popup_pool'))
+        self.notifier = self.makeNotifier()
+
+    def makeRing(self):
+        """The RingIcons for "icon_ring" and "icon_steps"; the current one if they did not change."""
+        settings = (self.config.get('icon_ring'), self.config.get('icon_steps'))
+        if settings == self.ringSettings:
+            return self.ring
+        self.ringSettings = settings
+        return RingIcons(steps=settings[1]) if settings[0] else None
+
+    def makeNotifier(self):
+        """Where messages go, per "notify": desktop notifications, tray balloons or popups."""
+        mode = self.config.get('notify')
+        if mode not in NOTIFY_MODES:
+            logger.warning("Unknown notify mode: %r", mode)
+            mode = "auto"
+        cmd = self.config.get('notify_cmd')
+        if mode in ("auto", "desktop") and CommandNotifier.available(cmd):
+            return CommandNotifier(cmd)
+        if mode == "tray" and TrayNotifier.available():
+            return TrayNotifier(self)
+        return self.popups
+
+    def popUp(self, title, message, timeout=None):
+        """Show a message without blocking; `title` and `message` may be text keys."""
+        if title in DEFAULTS:
+            title = self.getText(title)
+        if message in DEFAULTS:
+            message = self.getText(message)
+        self.metrics.count("popups_total")
+        if not self.notifier.notify(title, message, timeout):
+            self.popups.notify(title, message, timeout)
+
+
+def reportStartup(app, start):
+    """Print the time to the first idle event loop and the RSS, then quit."""
+    import json
+    import resource
+    app.processEvents()
+    print(json.dumps({
+        "visible": time.time() - start,
+        "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }))
+    sys.stdout.flush()
+    app.quit()
+
+
+def quitOnSignals(app, signums=(signal.SIGTERM, signal.SIGHUP)):
+    """Leave the event loop on SIGTERM or SIGHUP (as at logout), so the tray
+    shuts down cleanly; the signal wakes Qt through a socket, not a timer.
+    """
+    rd, wr = socket.socketpair()
+    wr.setblocking(False)
+    signal.set_wakeup_fd(wr.fileno())
+    for signum in signums:
+        # A Python-level handler is what makes the interpreter write to the fd.
+        signal.signal(signum, lambda *_: None)
+    notifier = QtCore.QSocketNotifier(rd.fileno(), QtCore.QSocketNotifier.Read, app)
+    app.connect(notifier, QtCore.SIGNAL("activated(int)"), lambda _: app.quit())
+    app.signalSockets = (rd, wr)
+
+
+def main(start=None):
+    start = start or time.time()
+    logging.basicConfig(level=os.environ.get("EASYTIMER_LOG", "WARNING").upper())
+    control = ControlServer(None)
+    if not control.listen():
+        print("EasyTimer is already running.")
+        sys.exit(0)
+    app = QtGui.QApplication(sys.argv)
+    app.setQuitOnLastWindowClosed(False)
+    w = QtGui.QWidget()
+    trayIcon = SystemTrayIcon(QtGui.QIcon(ICONS[-1]), w, control)
+
+    trayIcon.show()
+    quitOnSignals(app)
+    if os.environ.get("EASYTIMER_STARTUP"):
+        QtCore.QTimer.singleShot(0, lambda: reportStartup(app, start))
+    status = app.exec_()
+    trayIcon.shutdown()
+    sys.exit(status)